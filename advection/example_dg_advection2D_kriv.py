@@ -85,8 +85,10 @@ def define(filename_mesh=None,
             return {'val': val}
 
 
+    # velocity depends on coordinates only, stationary material is
+    # evaluated once for the whole time integration
     materials = {
-        'a': 'get_velocity',
+        'a': (None, 'get_velocity', 'stationary'),
     }
 
     regions = {
@@ -71,47 +71,24 @@ def define(filename_mesh=None,
         'i': 2 * approx_order,
     }
 
-    @local_register_function
-    def bc_funs(ts, coors, bc, problem):
-        # return 2*coors[..., 1]
-        t = ts.dt * ts.step
-        x_1 = coors[..., 0]
+    def grad_left_right(ts, coors, out):
         x_2 = coors[..., 1]
-        res = nm.zeros(nm.shape(x_1))
-
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        pi = nm.pi
-
-        if bc.diff == 0:
-            if "left" in bc.name:
-                res[:] = 0
-            elif "right" in bc.name:
-                res[:] = 0
-            elif "bottom" in bc.name:
-                res[:] = 0  # -2*sin(2*pi*x_1)
-            elif "top" in bc.name:
-                res[:] = 0
-
-        elif bc.diff == 1:
-            if "left" in bc.name:
-                res = nm.stack((-2 * pi * (x_2 ** 2 - x_2),
-                                res),
-                               axis=-2)
-            elif "right" in bc.name:
-                res = nm.stack((-2 * pi * (x_2 ** 2 - x_2), res,),
-                               axis=-2)
-            elif "bot" in bc.name:
-                res = nm.stack((res,
-                                sin(2 * pi * x_1)),
-                               axis=-2)
-            elif "top" in bc.name:
-                res = nm.stack((res,
-                                -sin(2 * pi * x_1)),
-                               axis=-2)
-
-        return res
+        nm.multiply(x_2, x_2 - 1, out=out)
+        out *= -2 * nm.pi
+
+    def get_grad_bottom_top(sign):
+        def grad_bottom_top(ts, coors, out):
+            nm.sin(2 * nm.pi * coors[..., 0], out=out)
+            out *= sign
+
+        return grad_bottom_top
+
+    bc_funs = BCRegistry(dim)
+    bc_funs.add("left", 0., [grad_left_right, 0.])
+    bc_funs.add("right", 0., [grad_left_right, 0.])
+    bc_funs.add("bot", 0., [0., get_grad_bottom_top(1)])  # -2*sin(2*pi*x_1)
+    bc_funs.add("top", 0., [0., get_grad_bottom_top(-1)])
+    local_register_function(bc_funs)
 
     @local_register_function
     def source_fun(ts, coors, mode="qp", **kwargs):
@@ -6,6 +6,11 @@ Antonietti, P., & Quarteroni, A. (2013). Numerical performance of discontinuous
 """
 
 from example_dg_common import *
+from manufactured_funs import (
+    quarteroni2_sol, quarteroni2_sol_grad, quarteroni2_source,
+    quarteroni2_bc_left, quarteroni2_bc_grad_left, quarteroni2_bc_right,
+    quarteroni2_bc_grad_right, quarteroni2_bc_bottom,
+    quarteroni2_bc_grad_bottom, quarteroni2_bc_top, quarteroni2_bc_grad_top)
 
 
 def define(filename_mesh=None,
@@ -71,121 +76,26 @@ def define(filename_mesh=None,
         'i': 2 * approx_order,
     }
 
-    @local_register_function
-    def bc_funs(ts, coors, bc, problem):
-        # return 2*coors[..., 1]
-        t = ts.dt * ts.step
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        res = nm.zeros(nm.shape(x_1))
-
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        pi = nm.pi
-        arctan = nm.arctan
-        sqrt = nm.sqrt
-
-        eps = diffcoef
-
-        if bc.diff == 0:
-            if "left" in bc.name:
-                res[:] = -arctan(
-                    1 / 16 * (4 * (2 * x_2 - 1) ** 2 + 3) / sqrt(eps))
-            elif "right" in bc.name:
-                res[:] = -arctan(
-                    1 / 16 * (4 * (2 * x_2 - 1) ** 2 + 3) / sqrt(eps))
-            elif "bot" in bc.name:
-                res[:] = -arctan(
-                    1 / 16 * (4 * (2 * x_1 - 1) ** 2 + 3) / sqrt(eps))
-            elif "top" in bc.name:
-                res[:] = -arctan(
-                    1 / 16 * (4 * (2 * x_1 - 1) ** 2 + 3) / sqrt(eps))
-
-        elif bc.diff == 1:
-            if "left" in bc.name:
-                res = nm.stack((256 / (((4 * (
-                            2 * x_2 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                    eps)),
-                                -256 * (2 * x_2 - 1) / (((4 * (
-                                            2 * x_2 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                                    eps))),
-                               axis=-2)
-            elif "right" in bc.name:
-                res = nm.stack((-256 / (((4 * (
-                            2 * x_2 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                    eps)),
-                                -256 * (2 * x_2 - 1) / (((4 * (
-                                            2 * x_2 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                                    eps))),
-                               axis=-2)
-            elif "bot" in bc.name:
-                res = nm.stack(((-256 * (2 * x_1 - 1) / (((4 * (
-                            2 * x_1 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                    eps)),
-                                 256 / (((4 * (
-                                             2 * x_1 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                                     eps)))),
-                               axis=-2)
-            elif "top" in bc.name:
-                res = nm.stack(((-256 * (2 * x_1 - 1) / (((4 * (
-                            2 * x_1 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                    eps)),
-                                 -256 / (((4 * (
-                                             2 * x_1 - 1) ** 2 + 3) ** 2 / eps + 256) * sqrt(
-                                     eps)))),
-                               axis=-2)
-
-        return res
+    bc_funs = BCRegistry(dim)
+    bc_funs.add("left", get_coors_bc_fun(quarteroni2_bc_left, diffcoef),
+                get_coors_bc_fun(quarteroni2_bc_grad_left, diffcoef))
+    bc_funs.add("right", get_coors_bc_fun(quarteroni2_bc_right, diffcoef),
+                get_coors_bc_fun(quarteroni2_bc_grad_right, diffcoef))
+    bc_funs.add("bot", get_coors_bc_fun(quarteroni2_bc_bottom, diffcoef),
+                get_coors_bc_fun(quarteroni2_bc_grad_bottom, diffcoef))
+    bc_funs.add("top", get_coors_bc_fun(quarteroni2_bc_top, diffcoef),
+                get_coors_bc_fun(quarteroni2_bc_grad_top, diffcoef))
+    local_register_function(bc_funs)
 
     @local_register_function
     def source_fun(ts, coors, mode="qp", **kwargs):
         # t = ts.dt * ts.step
-        eps = diffcoef
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        sqrt = nm.sqrt
-        pi = nm.pi
         if mode == "qp":
-            x_1 = coors[..., 0]
-            x_2 = coors[..., 1]
-            res = (-1024 * eps * (8 * (4 * (2 * x_1 - 1) ** 2 +
-                                       4 * (2 * x_2 - 1) ** 2 - 1) * (
-                                              2 * x_1 - 1) ** 2 /
-                                  (((4 * (2 * x_1 - 1) ** 2 + 4 * (
-                                              2 * x_2 - 1) ** 2 - 1) ** 2 / eps + 256) ** 2 * eps ** (
-                                               3 / 2))
-                                  + 8 * (4 * (2 * x_1 - 1) ** 2 +
-                                         4 * (2 * x_2 - 1) ** 2 - 1) * (
-                                              2 * x_2 - 1) ** 2 /
-                                  (((4 * (2 * x_1 - 1) ** 2 + 4 * (
-                                              2 * x_2 - 1) ** 2 - 1) ** 2 / eps + 256) ** 2 * eps ** (
-                                               3 / 2))
-                                  - 1 / (((4 * (2 * x_1 - 1) ** 2 + 4 * (
-                                2 * x_2 - 1) ** 2 - 1) ** 2 / eps + 256) * sqrt(
-                        eps)))
-                   - 256 * (2 * x_1 - 1) / (((4 * (2 * x_1 - 1) ** 2 + 4 * (
-                                2 * x_2 - 1) ** 2 - 1) ** 2 / eps + 256) * sqrt(
-                        eps))
-                   - 256 * (2 * x_2 - 1) / (((4 * (2 * x_1 - 1) ** 2 + 4 * (
-                                2 * x_2 - 1) ** 2 - 1) ** 2 / eps + 256) * sqrt(
-                        eps))
-                   )
+            res = quarteroni2_source(coors[..., 0], coors[..., 1], diffcoef)
             return {"val": res[..., None, None]}
 
     def analytic_sol(coors, t):
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        sin = nm.sin
-        pi = nm.pi
-        arctan = nm.arctan
-        sqrt = nm.sqrt
-        res = -arctan(1 / 16 * (
-                    4 * (2 * x_1 - 1) ** 2 + 4 * (2 * x_2 - 1) ** 2 - 1) / sqrt(
-            diffcoef))
-
-        return res
+        return quarteroni2_sol(coors[..., 0], coors[..., 1], diffcoef)
 
     @local_register_function
     def sol_fun(ts, coors, mode="qp", **kwargs):
@@ -193,6 +103,12 @@ def define(filename_mesh=None,
         if mode == "qp":
             return {"p": analytic_sol(coors, t)[..., None, None]}
 
+    def sol_grad_fun(ts, coors, mode="qp", **kwargs):
+        if mode == "qp":
+            grad = quarteroni2_sol_grad(coors[..., 0], coors[..., 1],
+                                        diffcoef)
+            return {"p_grad": nm.moveaxis(grad, 0, -1)[..., None]}
+
     dgebcs = {
         'u_left': ('left', {'p.all': "bc_funs", 'grad.p.all': "bc_funs"}),
         'u_top': ('top', {'p.all': "bc_funs", 'grad.p.all': "bc_funs"}),
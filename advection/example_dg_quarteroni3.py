@@ -6,6 +6,11 @@ Antonietti, P., & Quarteroni, A. (2013). Numerical performance of discontinuous
 """
 
 from example_dg_common import *
+from manufactured_funs import (
+    quarteroni3_sol, quarteroni3_sol_grad, quarteroni3_source,
+    quarteroni3_bc_left, quarteroni3_bc_grad_left, quarteroni3_bc_right,
+    quarteroni3_bc_grad_right, quarteroni3_bc_bottom,
+    quarteroni3_bc_grad_bottom, quarteroni3_bc_top, quarteroni3_bc_grad_top)
 
 
 def define(filename_mesh=None,
@@ -70,82 +75,28 @@ def define(filename_mesh=None,
         'i': 2 * approx_order,
     }
 
-    @local_register_function
-    def bc_funs(ts, coors, bc, problem):
-        # return 2*coors[..., 1]
-        t = ts.dt*ts.step
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        res = nm.zeros(nm.shape(x_1))
-
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        pi = nm.pi
-        arctan = nm.arctan
-        sqrt = nm.sqrt
-
-        eps = diffcoef
-
-        if bc.diff == 0:
-            if "left" in bc.name:
-                res[:] = x_2 + (exp((x_2 - 1)/eps) - exp(-1/eps))/(exp(-1/eps) - 1)
-            elif "right" in bc.name:
-                res[:] = 0
-            elif "bot" in bc.name:
-                res[:] = x_1 + (exp((x_1 - 1)/eps) - exp(-1/eps))/(exp(-1/eps) - 1)
-            elif "top" in bc.name:
-                res[:] = 0
-
-        elif bc.diff == 1:
-            if "left" in bc.name:
-                res = nm.stack((-x_2 - (x_2 - 1)*exp((x_2 - 1)/eps)/(eps*(exp(-1/eps) - 1)) + 1,
-                                exp((x_2 - 1)/eps)/(eps*(exp(-1/eps) - 1)) + 1),
-                               axis=-2)
-            elif "right" in bc.name:
-                res = nm.stack((-x_2 - (x_2 - 1)/(eps*(exp(-1/eps) - 1)) + 1,
-                                res),
-                               axis=-2)
-            elif "bot" in bc.name:
-                res = nm.stack((exp((x_1 - 1)/eps)/(eps*(exp(-1/eps) - 1)) + 1,
-                                -x_1 - (x_1 - 1)*exp((x_1 - 1)/eps)/(eps*(exp(-1/eps) - 1)) + 1),
-                               axis=-2)
-            elif "top" in bc.name:
-                res = nm.stack((res,
-                                -x_1 - (x_1 - 1)/(eps*(exp(-1/eps) - 1)) + 1),
-                               axis=-2)
-
-        return res
+    bc_funs = BCRegistry(dim)
+    bc_funs.add("left", get_coors_bc_fun(quarteroni3_bc_left, diffcoef),
+                get_coors_bc_fun(quarteroni3_bc_grad_left, diffcoef))
+    bc_funs.add("right", get_coors_bc_fun(quarteroni3_bc_right, diffcoef),
+                get_coors_bc_fun(quarteroni3_bc_grad_right, diffcoef))
+    bc_funs.add("bot", get_coors_bc_fun(quarteroni3_bc_bottom, diffcoef),
+                get_coors_bc_fun(quarteroni3_bc_grad_bottom, diffcoef))
+    bc_funs.add("top", get_coors_bc_fun(quarteroni3_bc_top, diffcoef),
+                get_coors_bc_fun(quarteroni3_bc_grad_top, diffcoef))
+    local_register_function(bc_funs)
 
 
     @local_register_function
     def source_fun(ts, coors, mode="qp", **kwargs):
         # t = ts.dt * ts.step
-        eps = diffcoef
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        sqrt = nm.sqrt
-        pi = nm.pi
         if mode == "qp":
-            x_1 = coors[..., 0]
-            x_2 = coors[..., 1]
-            res = -eps*((x_1 - 1)**2*exp(-(x_1 - 1)*(x_2 - 1)/eps)/(eps**2*(exp(-1/eps) - 1)) +
-                        (x_2 - 1)**2*exp(-(x_1 - 1)*(x_2 - 1)/eps)/(eps**2*(exp(-1/eps) - 1))) \
-                  - x_1 - x_2 - (x_1 - 1)*exp(-(x_1 - 1)*(x_2 - 1)/eps)/(eps*(exp(-1/eps) - 1)) - \
-                  (x_2 - 1)*exp(-(x_1 - 1)*(x_2 - 1)/eps)/(eps*(exp(-1/eps) - 1)) + 2
+            res = quarteroni3_source(coors[..., 0], coors[..., 1], diffcoef)
             return {"val": res[..., None, None]}
 
 
     def analytic_sol(coors, t):
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        sin = nm.sin
-        pi = nm.pi
-        exp = nm.exp
-        eps = diffcoef
-        res = -x_1*x_2 + x_1 + x_2 + (exp(-(x_1 - 1)*(x_2 - 1)/eps) - exp(-1/eps))/(exp(-1/eps) - 1)
-        return res
+        return quarteroni3_sol(coors[..., 0], coors[..., 1], diffcoef)
 
 
     @local_register_function
@@ -154,6 +105,12 @@ def define(filename_mesh=None,
         if mode == "qp":
             return {"p": analytic_sol(coors, t)[..., None, None]}
 
+    def sol_grad_fun(ts, coors, mode="qp", **kwargs):
+        if mode == "qp":
+            grad = quarteroni3_sol_grad(coors[..., 0], coors[..., 1],
+                                        diffcoef)
+            return {"p_grad": nm.moveaxis(grad, 0, -1)[..., None]}
+
 
     dgebcs = {
         'u_left' : ('left', {'p.all': "bc_funs", 'grad.p.all' : "bc_funs"}),
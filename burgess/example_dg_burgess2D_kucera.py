@@ -7,6 +7,12 @@ Charles University. p. 21 eq. (1.39)
 
 
 from example_dg_common import *
+from manufactured_funs import (
+    kucera_sol, kucera_sol_grad, kucera_space_source, kucera_space_bc_left,
+    kucera_space_bc_grad_left, kucera_space_bc_right,
+    kucera_space_bc_grad_right, kucera_space_bc_bottom,
+    kucera_space_bc_grad_bottom, kucera_space_bc_top,
+    kucera_space_bc_grad_top)
 from sfepy import data_dir
 
 
@@ -81,13 +87,7 @@ def define(filename_mesh=None,
     }
 
     def analytic_sol(coors, t):
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        sin = nm.sin
-        pi = nm.pi
-        exp = nm.exp
-        res = -(exp(-t) - 1)*(sin(5*x_1*x_2) + sin(-4*x_1*x_2 + 4*x_1 + 4*x_2))
-        return res
+        return kucera_sol(coors[..., 0], coors[..., 1], t)
 
     @local_register_function
     def sol_fun(ts, coors, mode="qp", **kwargs):
@@ -95,62 +95,36 @@ def define(filename_mesh=None,
         if mode == "qp":
             return {"p": analytic_sol(coors, t)[..., None, None]}
 
-    @local_register_function
-    def bc_funs(ts, coors, bc, problem):
-        # return 2*coors[..., 1]
-        t = ts.dt*ts.step
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        if bc.diff == 0:
-            if "left" in bc.name:
-                res = -(exp(-t) - 1)*(sin(-5*x_2) + sin(8*x_2 - 4))
-            elif "bottom" in bc.name:
-                res = -(exp(-t) - 1) * (sin(-5 * x_1) + sin(8 * x_1 - 4))
-            elif "right" in bc.name:
-                res = -(exp(-t) - 1)*(sin(4) + sin(5*x_2))
-            elif "top" in bc.name:
-                res = -(exp(-t) - 1)*(sin(4) + sin(5*x_1))
-
-        elif bc.diff == 1:
-            if "left" in bc.name:
-                res = nm.stack(((4*(x_2 - 1)*cos(4) - 5*x_2*cos(5*x_2))*(exp(-t) - 1),
-                                    -5*(exp(-t) - 1)*cos(5*x_2)),
-                               axis=-2)
-            elif "bottom" in bc.name:
-                res = nm.stack(((5*cos(-5*x_1) - 8*cos(8*x_1 - 4))*(exp(-t) - 1),
-                                -(5*x_1*cos(-5*x_1) - 4*(x_1 - 1)*cos(8*x_1 - 4))*(exp(-t) - 1)),
-                               axis=-2)
-
-            elif "right" in bc.name:
-                res = nm.stack(((4*(x_2 - 1)*cos(4) - 5*x_2*cos(5*x_2))*(exp(-t) - 1),
-                                -5*(exp(-t) - 1)*cos(5*x_2)),
-                               axis=-2)
-            elif "top" in bc.name:
-                res = nm.stack((-5*(exp(-t) - 1)*cos(5*x_1),
-                                (4*(x_1 - 1)*cos(4) - 5*x_1*cos(5*x_1))*(exp(-t) - 1)),
-                               axis=-2)
-
-        return res
+    def sol_grad_fun(ts, coors, mode="qp", **kwargs):
+        t = ts.time
+        if mode == "qp":
+            grad = kucera_sol_grad(coors[..., 0], coors[..., 1], t)
+            return {"p_grad": nm.moveaxis(grad, 0, -1)[..., None]}
+
+    def get_time_factor(ts):
+        t = ts.dt * ts.step
+        return 1 - nm.exp(-t)
+
+    def get_source_time_factors(ts):
+        t = ts.dt * ts.step
+        return nm.array([nm.exp(-t), (1 - nm.exp(-t)) ** 2, 1 - nm.exp(-t)])
+
+    bcs = BCRegistry(dim, time_fun=get_time_factor)
+    bcs.add("left", get_coors_bc_fun(kucera_space_bc_left),
+            get_coors_bc_fun(kucera_space_bc_grad_left))
+    bcs.add("bottom", get_coors_bc_fun(kucera_space_bc_bottom),
+            get_coors_bc_fun(kucera_space_bc_grad_bottom))
+    bcs.add("right", get_coors_bc_fun(kucera_space_bc_right),
+            get_coors_bc_fun(kucera_space_bc_grad_right))
+    bcs.add("top", get_coors_bc_fun(kucera_space_bc_top),
+            get_coors_bc_fun(kucera_space_bc_grad_top))
+    bc_funs = local_register_function(bcs)
 
     @local_register_function
+    @separable_in_time(get_source_time_factors)
     def source_fun(ts, coors, mode="qp", **kwargs):
         if mode == "qp":
-            t = ts.dt * ts.step
-            x_1 = coors[..., 0]
-            x_2 = coors[..., 1]
-            sin = nm.sin
-            cos = nm.cos
-            exp = nm.exp
-            res = (
-                    + (5 * x_1 * cos(5 * x_1 * x_2) - 4 * (x_1 - 1) * cos(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2)) * (exp(-t) - 1) ** 2 * (sin(5 * x_1 * x_2) - sin(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2))
-                    + (5 * x_2 * cos(5 * x_1 * x_2) - 4 * (x_2 - 1) * cos(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2)) * (exp(-t) - 1) ** 2 * (sin(5 * x_1 * x_2) - sin(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2))
-                    - ((25 * x_1 ** 2 * sin(5 * x_1 * x_2) - 16 * (x_1 - 1) ** 2 * sin(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2)) * (exp(-t) - 1)
-                     + (25 * x_2 ** 2 * sin(5 * x_1 * x_2) - 16 * (x_2 - 1) ** 2 * sin(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2)) * (exp(-t) - 1)) * diffcoef
-                    + (sin(5 * x_1 * x_2) - sin(4 * x_1 * x_2 - 4 * x_1 - 4 * x_2)) * exp(-t)
-            )
+            res = kucera_space_source(coors[..., 0], coors[..., 1], diffcoef)
             return {"val": res[..., None, None]}
 
     def adv_fun(p):
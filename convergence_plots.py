@@ -21,37 +21,34 @@ gel_names = {"1_2": "",
              "2_4": "Quadrilaterals"}
 
 
-def calculate_num_order(err_df):
+def calculate_num_order(err_df, dim=None, group_vars=("order",)):
     """
-    Uses diff_l2 and n_rows columns of the dataframe to calculate num_order,
-    splits dataframe on order column
-    :param err_df: dataframe, columns: ["n_rows", "order", diff_l2]
-    :return:
+    Uses diff_l2 and h columns of the dataframe to calculate num_order,
+    i.e. log(e_i / e_{i-1}) / log(h_i^dim / h_{i-1}^dim) for rows of each
+    group sorted by n_cells.
+
+    :param err_df: dataframe, columns: ["n_cells", "h", "diff_l2"] and
+        group_vars
+    :param dim: exponent of h, int, "gel" to take it per row from gel
+        column or None to use gel column if present and 1 otherwise
+    :param group_vars: columns identifying one convergence sequence, use e.g.
+        ("expid", "order") for aggregated results of parametric study
+    :return: dataframe sorted by group_vars and n_cells with num_order column
     """
-    res_df = pd.DataFrame()
-    for order in err_df["order"].unique():
-        order_err_df = err_df[err_df["order"] == order].sort_values("n_cells")
-
-        dim = int(err_df.iloc[0]["gel"][0])
-
-        num_orders = [nm.NAN]
-
-        last_err = order_err_df.iloc[0]["diff_l2"]
-        last_h = order_err_df.iloc[0]["h"]
-        #         print(order_err_df.iloc[1:, :])
-        for i, row in order_err_df.iloc[1:, :].iterrows():
-            num_order = nm.log(row["diff_l2"] / last_err) \
-                        / nm.log(row["h"] ** dim / last_h ** dim)
-            #             print(row["err_l2"] / last_err)
-            #             print(row["n_rows] / last_h)
-            #             print("-------------------")
-
-            last_err = row["diff_l2"]
-            last_h = row["h"]
-            num_orders.append(num_order)
-
-        order_err_df["num_order"] = num_orders
-        res_df = res_df.append(order_err_df)
+    group_vars = list(group_vars)
+    res_df = err_df.sort_values(group_vars + ["n_cells"], kind="mergesort")
+
+    if dim is None:
+        dim = "gel" if "gel" in res_df.columns else 1
+    if dim == "gel":
+        dim = res_df["gel"].str[0].astype(int).to_numpy()
+
+    groups = [res_df[var] for var in group_vars]
+    log_err_diff = nm.log(res_df["diff_l2"]).groupby(groups).diff()
+    log_h_diff = nm.log(res_df["h"]).groupby(groups).diff()
+
+    res_df = res_df.copy()
+    res_df["num_order"] = log_err_diff / (dim * log_h_diff)
     return res_df
 
 
@@ -235,12 +232,11 @@ def plot_agregated_var(df, y_var, x_var, color_var,
 
 if __name__ == '__main__':
     folder = Path(r"outputs/parametric/example_dg_burgess1D_hesthaven/")
-    df = pd.DataFrame()
-    for file in folder.glob("*.csv"):
-        df = df.append(
-            calculate_num_order(pd.read_csv(file).assign(
-                expid=file.name.split("r")[0].replace("_", "")))
-        )
+    df = calculate_num_order(
+        pd.concat([pd.read_csv(file).assign(
+                       expid=file.name.split("r")[0].replace("_", ""))
+                   for file in folder.glob("*.csv")]),
+        group_vars=("expid", "order"))
 
     print("order:")
     print(df["order"].unique())
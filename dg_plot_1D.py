@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
 """
-Script for plotting 1D DG FEM data stored in VTK files
+Script for plotting 1D DG FEM data stored in VTK files or DG time series
 """
 
 import glob
@@ -9,16 +9,255 @@ import glob
 import matplotlib
 matplotlib.use('Qt5Agg')
 import matplotlib.pyplot as plt
+from matplotlib import animation
 import argparse
 
 from os.path import join as pjoin
 import os
 import sys
+import json
 from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as nm
 
 from sfepy.discrete.dg.dg_1D_vizualizer import \
-    (load_1D_vtks, animate_1D_DG_sol, load_state_1D_vtk, plot1D_legendre_dofs,
-    reconstruct_legendre_dofs)
+    (load_state_1D_vtk, plot1D_legendre_dofs, reconstruct_legendre_dofs)
+
+from dg_time_series import DGTimeSeries, series_format, get_series_filename
+
+
+def _load_vtk_dofs(filename):
+    coors, u = load_state_1D_vtk(filename)
+    return u[:, :, 0, 0]
+
+
+class VTKFrames(object):
+    """
+    Lazily loaded frames of 1D DG solution in files <name>.<i>.vtk. The
+    files are indexed only, the first accessed frame is parsed right away
+    and the rest in parallel processes. Parsed DOFs are cached in binary
+    sidecar <name>.frames.npy, reused while the VTK files are unchanged.
+
+    Frames are DOFs of shape (order + 1, n_cell), times of the frames are
+    not stored in the files.
+    """
+
+    times = None
+
+    def __init__(self, folder, filename, n_workers=None):
+        """
+        :param folder: folder with the files
+        :param filename: name of the files without step and extension
+        :param n_workers: number of parsing processes, cpu count if None
+        """
+        self.files = sorted(glob(pjoin(folder, filename) + ".[0-9]*.vtk"),
+                            key=lambda fn: int(fn.split(".")[-2]))
+        if not self.files:
+            raise ValueError("no {}.*.vtk files in {}"
+                             .format(filename, folder))
+        self.n_workers = n_workers
+        self.sidecar = pjoin(folder, filename + ".frames.npy")
+        self.index_file = pjoin(folder, filename + ".frames.json")
+        self.index = [[os.path.basename(fn), os.stat(fn).st_size,
+                       os.stat(fn).st_mtime_ns] for fn in self.files]
+        self.futures = {}
+        self.executor = None
+
+        cached = self.load_index()
+        if cached is not None:
+            self.coors = nm.array(cached["coors"])[:, None]
+            self.data = nm.load(self.sidecar, mmap_mode="r")
+            self.loaded = nm.ones(len(self.files), dtype=bool)
+            return
+
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+        self.coors, u = load_state_1D_vtk(self.files[0])
+        self.data = nm.lib.format.open_memmap(
+            self.sidecar, mode="w+", dtype=nm.float64,
+            shape=(len(self.files),) + u.shape[:2])
+        self.data[0] = u[:, :, 0, 0]
+        self.loaded = nm.zeros(len(self.files), dtype=bool)
+        self.loaded[0] = True
+        self.start()
+        self.finish()
+
+    def load_index(self):
+        if not (os.path.exists(self.index_file)
+                and os.path.exists(self.sidecar)):
+            return None
+        with open(self.index_file) as f:
+            cached = json.load(f)
+        if cached["files"] != self.index:
+            return None
+        return cached
+
+    def start(self):
+        """
+        Starts parsing of frames not loaded yet in parallel processes.
+        """
+        if self.executor is not None or self.loaded.all():
+            return
+        self.executor = ProcessPoolExecutor(self.n_workers)
+        for ii in nm.flatnonzero(~self.loaded):
+            self.futures[ii] = self.executor.submit(_load_vtk_dofs,
+                                                    self.files[ii])
+
+    def collect(self, ii=None):
+        """
+        Stores parsed frames to the sidecar, waits for frame ii if given.
+        """
+        if ii is not None and not self.loaded[ii]:
+            self.start()
+            self.futures[ii].result()
+        for jj, future in list(self.futures.items()):
+            if future.done():
+                self.data[jj] = future.result()
+                self.loaded[jj] = True
+                del self.futures[jj]
+        self.finish()
+
+    def finish(self):
+        if not self.loaded.all():
+            return
+        self.data.flush()
+        with open(self.index_file, "w") as f:
+            json.dump({"files": self.index,
+                       "coors": self.coors[:, 0].tolist()}, f)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def close(self):
+        """
+        Waits for all frames so that the sidecar is complete.
+        """
+        for ii in list(self.futures):
+            self.collect(ii)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, ii):
+        ii = range(len(self))[ii]
+        if not self.loaded[ii]:
+            self.collect(ii)
+        elif self.futures:
+            self.collect()
+        return self.data[ii]
+
+
+class SeriesFrames(object):
+    """
+    Frames of 1D DG time series with the interface of VTKFrames, memory
+    mapped by the series.
+    """
+
+    def __init__(self, filename, var_name=None):
+        self.series = DGTimeSeries(filename)
+        self.var_name = var_name
+        self.coors = self.series.coors
+        self.times = self.series.times
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.series)
+
+    def __getitem__(self, ii):
+        return self.series.get_dofs(ii, self.var_name).T
+
+
+def get_series_file(folder, filename):
+    """
+    Returns DG time series file <filename>.dgts in folder, None if it does
+    not exist or it is older than VTK files of the same name, i.e. stale
+    output of an earlier run.
+    """
+    series_file = get_series_filename(pjoin(folder, filename))
+    if not os.path.exists(series_file):
+        return None
+    vtk_files = glob(pjoin(folder, filename) + ".[0-9]*.vtk")
+    if vtk_files and (max(os.path.getmtime(fn) for fn in vtk_files)
+                      > os.path.getmtime(series_file)):
+        return None
+    return series_file
+
+
+def get_frames(folder, filename):
+    """
+    Returns frames from DG time series file if it exists and is newer than
+    VTK files, otherwise from VTK files.
+    """
+    series_file = get_series_file(folder, filename)
+    if series_file is not None:
+        return SeriesFrames(series_file)
+    return VTKFrames(folder, filename)
+
+
+def animate_1D_DG_frames(frames, t0, t1, ic=None, exact=None, delay=100,
+                         polar=False):
+    """
+    Animates reconstructed 1D DG solution, frames are read and
+    reconstructed only when shown, so the animation starts right after
+    the first frame is available.
+
+    :param frames: VTKFrames or SeriesFrames
+    :param t0: starting time, used if frames do not have times
+    :param t1: final time, used if frames do not have times
+    :param ic: initial condition, function of x
+    :param exact: exact solution, function of x and t
+    :param delay: delay between frames in ms
+    :param polar: plot in polar projection
+    :return: figure and animation, keep reference to them
+    """
+    coors = frames.coors
+    n_frames = len(frames)
+    times = frames.times
+    if times is None:
+        times = nm.linspace(t0, t1, n_frames) if n_frames > 1 else [t0]
+
+    def reconstruct(ii):
+        ww, xx = reconstruct_legendre_dofs(coors, None,
+                                           frames[ii][:, :, None, None])
+        return nm.ravel(xx), nm.ravel(ww[:, 0])
+
+    fig = plt.figure("Reconstructed solution")
+    ax = fig.add_subplot(111, polar=polar)
+    xx, ww = reconstruct(0)
+    X1, XN = xx[0], xx[-1]
+    if polar:
+        to_plot = lambda x: 2 * nm.pi * (x - X1) / (XN - X1)
+    else:
+        to_plot = lambda x: x
+    if ic is not None:
+        ax.plot(to_plot(xx), nm.ravel(ic(xx)), 'grey', alpha=.6, label="ic")
+    sol_line, = ax.plot(to_plot(xx), ww, label="p(t, x)")
+    exact_line = None
+    if exact is not None:
+        exact_line, = ax.plot(to_plot(xx), nm.ravel(exact(xx, times[0])),
+                              "--", label="exact")
+    ax.legend()
+    bounds = [ww.min(), ww.max()]
+
+    def update(ii):
+        xx, ww = reconstruct(ii)
+        sol_line.set_data(to_plot(xx), ww)
+        if exact_line is not None:
+            exact_line.set_ydata(nm.ravel(exact(xx, times[ii])))
+        if ww.min() < bounds[0] or ww.max() > bounds[1]:
+            bounds[:] = min(bounds[0], ww.min()), max(bounds[1], ww.max())
+            margin = .1 * (bounds[1] - bounds[0]) + 1e-12
+            ax.set_ylim(bounds[0] - margin, bounds[1] + margin)
+        ax.set_title("t = {:.4f}".format(times[ii]))
+        return sol_line,
+
+    update(0)
+    anim = animation.FuncAnimation(fig, update, frames=n_frames,
+                                   interval=delay, repeat=True)
+    return fig, anim
 
 
 def load_and_plot_fun(folder, filename, t0, t1, tn,
@@ -45,21 +284,20 @@ def load_and_plot_fun(folder, filename, t0, t1, tn,
     polar : bool
     """
 
-    # load time data
-    lmesh, u = load_1D_vtks(folder, filename)
-    a1, a2 = animate_1D_DG_sol(lmesh, t0, t1, u, tn=tn, ic=ic_fun, exact=exact,
-                      delay=100, polar=polar)
+    # time data are loaded as the frames are shown
+    frames = get_frames(folder, filename)
+    if tn != len(frames):
+        print("Found {} frames instead of {}".format(len(frames), tn))
+    fig, anim = animate_1D_DG_frames(frames, t0, t1, ic=ic_fun, exact=exact,
+                                     delay=100, polar=polar)
 
     if compare:
-        files = glob(pjoin(folder, "*.vtk"))
-
-        n_first = sorted(files)[0].split(".")[-2]
-        n_last = sorted(files)[-1].split(".")[-2]
+        print("Plotting frames {} and {} to compare first and last"
+              .format(0, len(frames) - 1))
 
-        print("Plotting files {} and {} to compare first and last".format(n_first, n_last))
-
-        coors, u_end = load_state_1D_vtk(pjoin(folder, filename + "." + n_last + ".vtk"))
-        coors, u_start = load_state_1D_vtk(pjoin(folder, filename + "." + n_first + ".vtk"))
+        coors = frames.coors
+        u_end = nm.array(frames[-1])[:, :, None, None]
+        u_start = nm.array(frames[0])[:, :, None, None]
 
         plot1D_legendre_dofs(coors, [u_start.swapaxes(0, 1)[:, :, 0], u_end.swapaxes(0, 1)[:, :, 0]])
 
@@ -75,6 +313,7 @@ def load_and_plot_fun(folder, filename, t0, t1, tn,
         plt.plot(xx, ww_e[:, 0], label="p(1, x)")
         plt.legend()
     plt.show()
+    frames.close()
 
 
 def main(argv):
@@ -155,14 +394,24 @@ def main(argv):
     else:
         order = args.order
 
+    series_files = [fn for fn
+                    in glob(pjoin(full_infolder_path, "*." + series_format))
+                    if get_series_file(full_infolder_path,
+                                       os.path.basename(fn).split(".")[0])]
     contents = glob(pjoin(full_infolder_path, "*.vtk"))
     print()
-    tn = len(contents)  # we assume the contents are time step data files
-    if tn == 0:
-        print("Input folder {} is empty!".format(full_infolder_path))
-        return
-    base_name = os.path.basename(contents[0]).split(".")[0]
-    print("Found {} files, basename is {}".format(tn, base_name))
+    if series_files:
+        base_name = os.path.basename(series_files[0]).split(".")[0]
+        tn = len(DGTimeSeries(series_files[0]))
+        print("Found time series with {} frames, basename is {}"
+              .format(tn, base_name))
+    else:
+        tn = len(contents)  # we assume the contents are time step data files
+        if tn == 0:
+            print("Input folder {} is empty!".format(full_infolder_path))
+            return
+        base_name = os.path.basename(contents[0]).split(".")[0]
+        print("Found {} files, basename is {}".format(tn, base_name))
     print("Plotting ...")
     load_and_plot_fun(full_infolder_path, base_name, t0, t1, tn,
                       compare=cf, polar=pol)
@@ -0,0 +1,109 @@
+"""
+Direct evaluation of DG solutions in quadrature points.
+
+Values and gradients are computed from the DOFs returned by
+DGField.unravel_sol and Legendre basis tables precomputed in reference
+quadrature points, without assembling terms through Problem.evaluate.
+"""
+import numpy as nm
+
+from sfepy.base.base import output
+from sfepy.discrete import Integral, Integrals
+from sfepy.discrete.fem.poly_spaces import PolySpace
+
+
+class DGQPEvaluator(object):
+    """
+    Evaluates scalar DG field and its gradient in quadrature points of the
+    integral, all cells of the field region share one reference element,
+    so every evaluation is a single einsum over all cells.
+
+    Shapes of the results match mode='qp' of ev_volume_integrate and
+    ev_grad terms.
+    """
+
+    def __init__(self, field, integral):
+        self.field = field
+        self.integral = integral
+        gel = field.gel
+        qp_coors, weights = integral.get_qp(gel.name)
+        self.n_qp = len(weights)
+        self.dim = gel.dim
+        self.n_el_nod = field.n_el_nod
+
+        # Legendre basis in reference qps
+        self.base = field.poly_space.eval_base(qp_coors).reshape(
+            (self.n_qp, self.n_el_nod))
+        self.base_grad = field.poly_space.eval_base(qp_coors, diff=True) \
+            .reshape((self.n_qp, self.dim, self.n_el_nod))
+
+        # affine geometry of the cells
+        geo_ps = PolySpace.any_from_args(None, gel, 1)
+        geo_base = geo_ps.eval_base(qp_coors)[:, 0, :]
+        geo_grad = geo_ps.eval_base(qp_coors, diff=True)
+        mesh = field.domain.mesh
+        cell_coors = mesh.coors[mesh.get_conn(gel.name)[field.region.cells]]
+
+        self.qps = nm.einsum("qn,cni->cqi", geo_base, cell_coors)
+        jac = nm.einsum("cni,qjn->cqij", cell_coors, geo_grad)
+        self.inv_jac = nm.linalg.inv(jac)
+        self.det = (nm.abs(nm.linalg.det(jac)) * weights)[..., None, None]
+
+    def unravel(self, vec):
+        """
+        :param vec: DG state vector of the field
+        :return: DOFs, shape (n_cell, n_el_nod)
+        """
+        return self.field.unravel_sol(vec).reshape((-1, self.n_el_nod))
+
+    def eval_vals(self, dofs):
+        """
+        :param dofs: DOFs, shape (n_cell, n_el_nod)
+        :return: values, shape (n_cell, n_qp, 1, 1)
+        """
+        return nm.einsum("qb,cb->cq", self.base, dofs)[..., None, None]
+
+    def eval_grads(self, dofs):
+        """
+        :param dofs: DOFs, shape (n_cell, n_el_nod)
+        :return: physical gradients, shape (n_cell, n_qp, dim, 1)
+        """
+        return nm.einsum("cqji,qjb,cb->cqi", self.inv_jac, self.base_grad,
+                         dofs, optimize=True)[..., None]
+
+
+def validate_qp_evaluator(pb, quad_order, var_name="p", rtol=1e-10):
+    """
+    Compares DGQPEvaluator with the ev_volume_integrate and ev_grad terms
+    evaluated by pb.
+
+    :param pb: problem with numerical solution
+    :param quad_order: order of the quadrature
+    :param var_name: name of the DG variable
+    :param rtol: tolerance of max. difference relative to max. value
+    :return: max. relative differences of values and gradients
+    :raises ValueError: if a difference exceeds rtol
+    """
+    var = pb.get_variables()[var_name]
+    idiff = Integral('idiff', quad_order)
+    evaluator = DGQPEvaluator(var.field, idiff)
+    dofs = evaluator.unravel(var())
+
+    diffs = []
+    for term, fun in [("ev_volume_integrate", evaluator.eval_vals),
+                      ("ev_grad", evaluator.eval_grads)]:
+        term_qp = pb.evaluate(
+            '{}.idiff.Omega({})'.format(term, var_name),
+            integrals=Integrals([idiff]), mode='qp',
+            copy_materials=False, verbose=False
+        )
+        direct_qp = fun(dofs)
+        diffs.append(nm.max(nm.abs(direct_qp - term_qp))
+                     / max(nm.max(nm.abs(term_qp)), 1e-300))
+
+    output("qp evaluator differences: values {:.2e}, gradients {:.2e}"
+           .format(*diffs))
+    if max(diffs) > rtol:
+        raise ValueError("qp evaluator differs from terms by {:.2e}"
+                         .format(max(diffs)))
+    return tuple(diffs)
@@ -19,22 +19,19 @@ import numpy as nm
 import pandas as pd
 import numpy as nm
 
-from sfepy.discrete.equations import Equation, Equations
-from sfepy.discrete.variables import FieldVariable
 from sfepy.discrete.fem import FEDomain
 from sfepy.discrete.fem.meshio import MeshioLibIO
 from sfepy.discrete.fem.mesh import Mesh
 from sfepy.discrete.functions import make_sfepy_function, Function
-from sfepy.discrete.integrals import Integral, Integrals
-from sfepy.discrete.materials import Material
-from sfepy.discrete.problem import Problem
-from sfepy.terms.terms_basic import SurfaceTerm
+from sfepy.discrete.integrals import Integral
 from sfepy.discrete.dg.fields import DGField
 
 from sfepy.discrete.dg.dg_1D_vizualizer import \
     (load_1D_vtks, animate_1D_DG_sol, load_state_1D_vtk, plot1D_legendre_dofs,
     reconstruct_legendre_dofs)
 
+from dg_qp_eval import DGQPEvaluator
+
 def head(l):
     if l:
         return l[0]
@@ -88,23 +85,12 @@ def load_and_plot_fun(folder, filename, exact=None):
     # Sufficient quadrature order for the analytical expression.
     idiff = Integral('idiff', 20)
 
-    u = FieldVariable("u", "unknown", field)
-
-    eqs = Equations(
-        [Equation('balance', SurfaceTerm("s()", "u", idiff, omega, u=u))])
-    pb = Problem("err_est", equations=eqs)
-
-    u.set_data(field.ravel_sol(data.swapaxes(0, 1)))
-
-    num_qp = pb.evaluate('ev_volume_integrate.idiff.Omega(u)',
-                         u=u,
-                         integrals=Integrals([idiff]), mode='qp')
+    evaluator = DGQPEvaluator(field, idiff)
+    num_qp = evaluator.eval_vals(
+        data.swapaxes(0, 1).reshape((-1, evaluator.n_el_nod)))
 
-    aux = Material('aux', function=sol_fun)
-    ana_qp = pb.evaluate('ev_volume_integrate_mat.idiff.Omega(aux.u, u)',
-                         aux=aux, u=u,
-                         integrals=Integrals([idiff]), mode='qp')
-    qps = pb.fields["f"].mapping.get_physical_qps(idiff.get_qp("1_2")[0])
+    qps = evaluator.qps
+    ana_qp = analytic_sol(qps, 1.)
     fqps = qps.flatten()
 
     plt.figure("Reconstructed solution")
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Single file time series of DG solutions.
+
+The file holds the mesh once followed by records appended for saved time
+steps, each with time, step and DOF vectors of the DG variables, so that
+a transient run writes one file instead of one .vtk or .msh file per
+saved step. Frames are read by memory mapping the records, VTK or gmsh-dg
+files are exported on demand.
+
+Layout of the file, all parts start at multiples of 64 bytes::
+
+    magic | header length | JSON header | coors | conn | mat_ids | records
+"""
+import json
+import os
+import sys
+import argparse
+
+import numpy as nm
+
+from sfepy.base.base import output, Struct
+
+magic = b"DGTS\x00\x01"
+align = 64
+series_format = "dgts"
+
+
+def _aligned(offset):
+    return -(-offset // align) * align
+
+
+def get_series_filename(filename_trunk):
+    return "{}.{}".format(filename_trunk, series_format)
+
+
+def get_save_steps(save_times, n_step, times=None):
+    """
+    Returns steps saved for save_times option, "all", number of saved
+    steps evenly spread over the run, including the last step, or
+    sequence of times, each saved in the first step reaching it.
+
+    :param save_times:
+    :param n_step: number of time steps
+    :param times: times of the steps, needed for sequence of times
+    """
+    if isinstance(save_times, str):
+        if save_times != "all":
+            raise ValueError("save_times must be 'all', int or sequence of "
+                             "times, not {!r}".format(save_times))
+        return set(range(n_step))
+    if nm.isscalar(save_times):
+        n_save = min(int(save_times), n_step)
+        return set(nm.linspace(0, n_step - 1, n_save).round().astype(int))
+    if times is None:
+        raise ValueError("save_times given as sequence of times needs times "
+                         "of the steps")
+    times = nm.asarray(times)[:n_step]
+    # tolerance keeps round-off of step times from skipping to next step
+    steps = nm.searchsorted(times, nm.asarray(save_times, dtype=nm.float64)
+                            - 1e-10 * (abs(times[-1] - times[0]) + 1.))
+    return set(nm.minimum(steps, n_step - 1).tolist())
+
+
+class DGTimeSeriesWriter(object):
+    """
+    Appends DG states to time series file, the header and mesh are
+    written with the first state. Each record is flushed, so a crashed
+    run leaves the frames saved before it readable.
+    """
+
+    def __init__(self, filename, var_names=None):
+        """
+        :param filename: .dgts file, overwritten
+        :param var_names: names of saved DG variables, all state variables
+            if None
+        """
+        self.filename = filename
+        self.var_names = var_names
+        self.n_frames = 0
+        self._file = None
+
+    def _write_header(self, pb, ts, variables):
+        if self.var_names is None:
+            self.var_names = list(variables.state)
+        mesh = pb.domain.mesh
+        desc = mesh.descs[0]
+        arrays = [("coors", nm.ascontiguousarray(mesh.coors, nm.float64)),
+                  ("conn", nm.ascontiguousarray(mesh.get_conn(desc),
+                                                nm.int64)),
+                  ("mat_ids", nm.ascontiguousarray(mesh.cmesh.cell_groups,
+                                                   nm.int64))]
+        fields = {name: variables[name].field for name in self.var_names}
+        header = {"version": 1,
+                  "name": mesh.name,
+                  "desc": desc,
+                  "dim": int(mesh.dim),
+                  "n_step": int(ts.n_step),
+                  "vars": [[name, int(field.n_el_nod), int(field.n_cell),
+                            int(field.approx_order)]
+                           for name, field in fields.items()],
+                  "arrays": {}}
+
+        # offsets depend on the header length, grow it until it fits
+        start = 0
+        while True:
+            offset = start
+            for name, arr in arrays:
+                header["arrays"][name] = [offset, list(arr.shape)]
+                offset = _aligned(offset + arr.nbytes)
+            header["data_offset"] = offset
+            raw = json.dumps(header).encode("utf-8")
+            if len(magic) + 8 + len(raw) <= start:
+                break
+            start = _aligned(len(magic) + 8 + len(raw))
+
+        self._file = open(self.filename, "wb")
+        self._file.write(magic)
+        self._file.write(nm.int64(len(raw)).tobytes())
+        self._file.write(raw)
+        for name, arr in arrays:
+            self._file.seek(header["arrays"][name][0])
+            self._file.write(arr.tobytes())
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def append(self, pb, ts, variables):
+        """
+        Appends state of variables at time step ts.
+        """
+        if self._file is None:
+            self._write_header(pb, ts, variables)
+        self._file.write(nm.array([ts.time]).tobytes())
+        self._file.write(nm.array([ts.step], dtype=nm.int64).tobytes())
+        for name in self.var_names:
+            self._file.write(nm.asarray(variables[name](),
+                                        dtype=nm.float64).tobytes())
+        self._file.flush()
+        self.n_frames += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class DGTimeSeriesHook(object):
+    """
+    Step hook of Problem.solve appending saved steps to DG time series,
+    replaces saving of the problem with save_times set to 0.
+    """
+
+    def __init__(self, filename, save_times="all", var_names=None):
+        """
+        :param filename: .dgts file
+        :param save_times: "all", number of saved steps or sequence of
+            saved times
+        :param var_names: names of saved DG variables
+        """
+        self.writer = DGTimeSeriesWriter(filename, var_names)
+        self.save_times = save_times
+        self.save_steps = None
+
+    def __call__(self, pb, ts, variables):
+        if self.save_steps is None:
+            self.save_steps = get_save_steps(self.save_times, ts.n_step,
+                                             getattr(ts, "times", None))
+        if ts.step in self.save_steps:
+            self.writer.append(pb, ts, variables)
+
+    def close(self):
+        self.writer.close()
+
+
+class DGTimeSeries(object):
+    """
+    Reader of DG time series, frames are memory mapped and read only when
+    accessed. A record being written by a running solver is ignored.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            if f.read(len(magic)) != magic:
+                raise ValueError("{} is not DG time series file"
+                                 .format(filename))
+            n_raw = int(nm.frombuffer(f.read(8), dtype=nm.int64)[0])
+            self.header = json.loads(f.read(n_raw).decode("utf-8"))
+
+        header = self.header
+        self.name = header["name"]
+        self.desc = header["desc"]
+        self.dim = header["dim"]
+        self.var_names = [name for name, _, _, _ in header["vars"]]
+        self.n_el_nod = {name: n_el_nod
+                         for name, n_el_nod, _, _ in header["vars"]}
+        self.approx_order = {name: order
+                             for name, _, _, order in header["vars"]}
+        self.n_cell = header["vars"][0][2]
+
+        for name, dtype in [("coors", nm.float64), ("conn", nm.int64),
+                            ("mat_ids", nm.int64)]:
+            offset, shape = header["arrays"][name]
+            setattr(self, name,
+                    nm.array(nm.memmap(filename, dtype=dtype, mode="r",
+                                       offset=offset, shape=tuple(shape))))
+
+        self.dtype = nm.dtype([("time", nm.float64), ("step", nm.int64)]
+                              + [(name, nm.float64, (n_el_nod, n_cell))
+                                 for name, n_el_nod, n_cell, _
+                                 in header["vars"]])
+        data_offset = header["data_offset"]
+        self.n_frames = ((os.path.getsize(filename) - data_offset)
+                         // self.dtype.itemsize)
+        if self.n_frames:
+            self.records = nm.memmap(filename, dtype=self.dtype, mode="r",
+                                     offset=data_offset,
+                                     shape=(self.n_frames,))
+        else:
+            self.records = nm.zeros(0, dtype=self.dtype)
+        self.times = self.records["time"]
+        self.steps = self.records["step"]
+        self.n_step = header["n_step"]
+
+    def __len__(self):
+        return self.n_frames
+
+    def get_vec(self, ii, var_name=None):
+        """
+        :return: DG state vector of the variable in frame ii
+        """
+        var_name = self.var_names[0] if var_name is None else var_name
+        return self.records[var_name][ii].reshape(-1)
+
+    def get_dofs(self, ii, var_name=None):
+        """
+        :return: DOFs of the variable in frame ii, shape (n_cell, n_el_nod),
+            i.e. as returned by DGField.unravel_sol
+        """
+        var_name = self.var_names[0] if var_name is None else var_name
+        return self.records[var_name][ii].T
+
+    def create_mesh(self):
+        from sfepy.discrete.fem import Mesh
+        return Mesh.from_data(self.name, self.coors, None, [self.conn],
+                              [self.mat_ids], [self.desc])
+
+    def create_output(self, ii):
+        """
+        Returns output of frame ii with modal DOFs as cell data named
+        <var>_modal<i>, like DGField writes them to VTK.
+        """
+        out = {}
+        for name in self.var_names:
+            dofs = self.get_dofs(ii, name)
+            for jj in range(dofs.shape[1]):
+                out["{}_modal{}".format(name, jj)] = \
+                    Struct(name="output_data", mode="cell",
+                           data=nm.array(dofs[:, jj, None, None]),
+                           dofs=None)
+        return out
+
+
+def export_frames(series, filename_trunk, output_format="vtk", frames=None,
+                  pb=None, file_format=None):
+    """
+    Exports frames of DG time series to files
+    <filename_trunk>.<step>.<output_format> numbered by the saved time
+    steps and padded like files saved by the solver.
+
+    :param series: DGTimeSeries or its file name
+    :param filename_trunk: output file name without suffix and extension
+    :param output_format: file extension, vtk or msh
+    :param frames: indices of exported frames, all if None
+    :param pb: problem with the same variables, needed for output other
+        than modal DOFs in VTK, its state is overwritten
+    :param file_format: file format passed to Problem.save_state,
+        e.g. gmsh-dg
+    :return: list of written files
+    """
+    if not isinstance(series, DGTimeSeries):
+        series = DGTimeSeries(series)
+    if frames is None:
+        frames = range(len(series))
+
+    n_digit = len(str(max(series.n_step - 1, 0)))
+    filenames = []
+    mesh = None
+    for ii in frames:
+        filename = "{}.{:0{}d}.{}".format(filename_trunk,
+                                          int(series.steps[ii]), n_digit,
+                                          output_format)
+        if pb is None:
+            if mesh is None:
+                mesh = series.create_mesh()
+            mesh.write(filename, io="auto", out=series.create_output(ii))
+        else:
+            variables = pb.get_variables()
+            for name in series.var_names:
+                variables[name].set_data(series.get_vec(ii, name))
+            pb.save_state(filename, state=variables, file_format=file_format)
+        filenames.append(filename)
+
+    output("Exported {} frames of {} to {}.*.{}"
+           .format(len(filenames), series.filename, filename_trunk,
+                   output_format))
+    return filenames
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Export frames of DG time series to VTK files with "
+                    "modal DOFs")
+    parser.add_argument("series_file", metavar="path",
+                        help="DG time series .{} file".format(series_format))
+    parser.add_argument("--output", metavar="path", default=None,
+                        dest="output_trunk",
+                        help="Output file name trunk, default is the series "
+                             "file name without extension")
+    parser.add_argument("--frames", metavar="int", type=int, nargs="+",
+                        default=None, help="Indices of exported frames")
+
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+
+    series = DGTimeSeries(args.series_file)
+    output("{}: {} frames, times {} - {}"
+           .format(args.series_file, len(series),
+                   series.times[0] if len(series) else None,
+                   series.times[-1] if len(series) else None))
+    output_trunk = args.output_trunk
+    if output_trunk is None:
+        output_trunk = os.path.splitext(args.series_file)[0]
+    export_frames(series, output_trunk, "vtk", args.frames)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
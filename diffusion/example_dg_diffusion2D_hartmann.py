@@ -70,38 +70,25 @@ def define(filename_mesh=None,
         if mode == "qp":
             return {"p": analytic_sol(coors, t)[..., None, None]}
 
-    @local_register_function
-    def bc_funs(ts, coors, bc, problem):
-        # return 2*coors[..., 1]
-        t = ts.dt*ts.step
-        x_1 = coors[..., 0]
-        x_2 = coors[..., 1]
-        res = nm.zeros(x_1.shape)
-        sin = nm.sin
-        cos = nm.cos
-        exp = nm.exp
-        pi = nm.pi
-        if bc.diff == 0:
-            if "left" in bc.name:
-                res[:] = 0
-            elif "bottom" in bc.name:
-                res[:] = 0
-            elif "right" in bc.name:
-                res[:] = sin(1/2*pi*x_2)
-            elif "top" in bc.name:
-                res[:] = sin(1/2*pi*x_1)
-
-        elif bc.diff == 1:
-            if "left" in bc.name:
-                res = nm.stack((1/2*pi*sin(1/2*pi*x_2), res), axis=-2)
-            elif "bottom" in bc.name:
-                res = nm.stack((res, 1/2*pi*sin(1/2*pi*x_1)), axis=-2)
-            elif "right" in bc.name:
-                res = nm.stack((res, 1/2*pi*cos(1/2*pi*x_2)), axis=-2)
-            elif "top" in bc.name:
-                res = nm.stack((1/2*pi*cos(1/2*pi*x_1), res), axis=-2)
-
-        return res
+    def get_trig_bc(trig, ii, coef=1.):
+        """
+        Returns BC callable evaluating coef * trig(pi / 2 * x_ii).
+        """
+        def bc_fun(ts, coors, out):
+            nm.multiply(nm.pi / 2, coors[..., ii], out=out)
+            trig(out, out=out)
+            out *= coef
+
+        return bc_fun
+
+    bc_funs = BCRegistry(dim)
+    bc_funs.add("left", 0., [get_trig_bc(nm.sin, 1, nm.pi / 2), 0.])
+    bc_funs.add("bottom", 0., [0., get_trig_bc(nm.sin, 0, nm.pi / 2)])
+    bc_funs.add("right", get_trig_bc(nm.sin, 1),
+                [0., get_trig_bc(nm.cos, 1, nm.pi / 2)])
+    bc_funs.add("top", get_trig_bc(nm.sin, 0),
+                [get_trig_bc(nm.cos, 0, nm.pi / 2), 0.])
+    local_register_function(bc_funs)
 
     @local_register_function
     def source_fun(ts, coors, mode="qp", **kwargs):
@@ -4,6 +4,9 @@ Functions common to DG examples
 import numpy as nm
 from glob import glob
 import os
+import functools
+import hashlib
+from collections import OrderedDict
 
 from sfepy.mesh.mesh_generators import gen_block_mesh
 from sfepy.discrete.fem import Mesh
@@ -23,3 +26,200 @@ from sfepy.discrete.dg.limiters import IdentityLimiter, MomentLimiter1D, \
 from examples.dg.example_dg_common import *
 
 
+def get_coors_key(coors):
+    coors = nm.ascontiguousarray(coors)
+    return coors.shape, hashlib.blake2b(coors, digest_size=16).digest()
+
+
+def get_args_key(args, kwargs):
+    """
+    Returns key of arguments of registered function which can change its
+    value, boundary conditions are represented by name and diff, other
+    objects like problem or term are ignored.
+    """
+    key = []
+    for val in list(args) + [kwargs[name] for name in sorted(kwargs)]:
+        if isinstance(val, (str, int, float, bool, type(None))):
+            key.append(val)
+        elif hasattr(val, "name") and hasattr(val, "diff"):
+            key.append((val.name, val.diff))
+    return tuple(key)
+
+
+def separable_in_time(time_fun=None, maxsize=32):
+    """
+    Decorator caching registered functions fun(ts, coors, ...) with
+    values separable in time, i.e. sum_k T_k(ts) * S_k(coors). The
+    decorated function returns only the spatial factors S_k, which are
+    memoized per coordinate array and other arguments, and are then
+    only combined with T_k(ts) in each call.
+
+    :param time_fun: function of ts returning the temporal factor, the
+        value returned by decorated function is then the spatial factor,
+        or sequence of the factors, the values returned by decorated
+        function then have the spatial factors along their first axis;
+        None for time independent functions, the cached values are then
+        returned as they are
+    :param maxsize: max. number of cached coordinate arrays
+    """
+    def decorator(fun):
+        cache = OrderedDict()
+
+        @functools.wraps(fun)
+        def cached_fun(ts, coors, *args, **kwargs):
+            key = get_coors_key(coors) + get_args_key(args, kwargs)
+            if key in cache:
+                cache.move_to_end(key)
+                factors = cache[key]
+            else:
+                factors = cache[key] = fun(ts, coors, *args, **kwargs)
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+
+            if time_fun is None or factors is None:
+                return factors
+
+            weights = time_fun(ts)
+
+            def combine(vals):
+                if nm.ndim(weights) == 0:
+                    return weights * vals
+                return nm.tensordot(weights, vals, axes=1)
+
+            if isinstance(factors, dict):
+                return {name: combine(vals) for name, vals in factors.items()}
+            return combine(factors)
+
+        cached_fun.cache = cache
+        return cached_fun
+
+    return decorator
+
+
+class BCRegistry(object):
+    """
+    Boundary condition function dispatching to value and gradient
+    callables registered for region keys, the key matching name of the
+    condition is found in the first call only.
+
+    Values are constants or callables fun(ts, coors, out) filling
+    preallocated out of shape coors.shape[:-1]. Gradients are callables
+    filling out of shape (dim,) + coors.shape[:-1] or sequences of dim
+    values. Time independent conditions are evaluated once per coordinate
+    array, with time_fun given they are multiplied by its value in each
+    call, i.e. their values are separable in time.
+
+    Registered as bc_funs the instance returns the same arrays as
+    functions with nm.stack((grad_1, ..., grad_dim), axis=-2), the arrays
+    are owned by the registry and must not be modified.
+    """
+
+    def __init__(self, dim, name="bc_funs", maxsize=32, time_fun=None):
+        """
+        :param dim: space dimension
+        :param name: name of the registered function
+        :param maxsize: max. number of cached values of time independent
+            conditions
+        :param time_fun: function of ts returning temporal factor of time
+            independent conditions, None for conditions constant in time
+        """
+        self.dim = dim
+        self.__name__ = name
+        self.maxsize = maxsize
+        self.time_fun = time_fun
+        self.entries = []
+        self.matched = {}
+        self.buffers = {}
+        self.cache = OrderedDict()
+
+    def add(self, key, value=0., grad=None, time_dependent=False):
+        """
+        Registers condition for regions with key in the condition name,
+        keys are matched in the order of registration.
+
+        :param key: part of the condition name, e.g. "left"
+        :param value: constant or callable fun(ts, coors, out)
+        :param grad: callable fun(ts, coors, out) or sequence of dim
+            constants or callables, zero if None
+        :param time_dependent: if False values are cached
+        """
+        if grad is None:
+            grad = [0.] * self.dim
+        self.entries.append((key, (value, grad), time_dependent))
+        self.matched.clear()
+        return self
+
+    def match(self, name):
+        entry = self.matched.get(name)
+        if entry is None:
+            for key, funs, time_dependent in self.entries:
+                if key in name:
+                    entry = self.matched[name] = (funs, time_dependent)
+                    break
+            else:
+                raise ValueError("no boundary condition for {}".format(name))
+        return entry
+
+    def get_buffer(self, key, shape):
+        buf = self.buffers.get(key)
+        if buf is None or buf.shape != shape:
+            buf = self.buffers[key] = nm.empty(shape)
+        return buf
+
+    @staticmethod
+    def fill(spec, ts, coors, out):
+        if callable(spec):
+            spec(ts, coors, out)
+        else:
+            out[...] = spec
+
+    def evaluate(self, ts, coors, name, diff, out):
+        (value, grad), _ = self.match(name)
+        if diff == 0:
+            self.fill(value, ts, coors, out)
+        elif callable(grad):
+            grad(ts, coors, out)
+        else:
+            for ii, spec in enumerate(grad):
+                self.fill(spec, ts, coors, out[ii])
+        return out
+
+    def __call__(self, ts, coors, bc, problem):
+        _, time_dependent = self.match(bc.name)
+        shape = coors.shape[:-1]
+        if bc.diff == 1:
+            shape = (self.dim,) + shape
+
+        if time_dependent:
+            out = self.get_buffer((bc.name, bc.diff), shape)
+            self.evaluate(ts, coors, bc.name, bc.diff, out)
+        else:
+            key = (bc.name, bc.diff) + get_coors_key(coors)
+            out = self.cache.get(key)
+            if out is None:
+                out = self.evaluate(ts, coors, bc.name, bc.diff,
+                                    nm.empty(shape))
+                self.cache[key] = out
+                if len(self.cache) > self.maxsize:
+                    self.cache.popitem(last=False)
+            else:
+                self.cache.move_to_end(key)
+            if self.time_fun is not None:
+                out = nm.multiply(out, self.time_fun(ts),
+                                  out=self.get_buffer(key[:2], shape))
+
+        if bc.diff == 1:
+            return nm.moveaxis(out, 0, -2)
+        return out
+
+
+def get_coors_bc_fun(fun, *args):
+    """
+    Adapts function fun(x_1, ..., x_dim, *args, out=None), e.g. from
+    manufactured_funs, to value or gradient callable of BCRegistry.
+    """
+    def bc_fun(ts, coors, out):
+        return fun(*[coors[..., ii] for ii in range(coors.shape[-1])],
+                   *args, out=out)
+
+    return bc_fun
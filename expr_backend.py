@@ -0,0 +1,90 @@
+"""
+Optional multithreaded evaluation of elementwise functions.
+
+Functions decorated by elementwise are evaluated in chunks of the
+flattened arguments on a thread pool, NumPy ufuncs release GIL so the
+chunks run in parallel, and temporaries of each chunk are bounded by the
+chunk size. With one thread, the default, functions are called directly.
+"""
+import inspect
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as nm
+
+n_threads = 1
+chunk_size = 2 ** 16
+_pool = None
+
+
+def set_num_threads(num, size=None):
+    """
+    Sets number of threads used by elementwise functions.
+
+    :param num: number of threads, 1 evaluates in the calling thread
+    :param size: number of elements in one chunk, unchanged if None
+    """
+    global n_threads, chunk_size, _pool
+    if size is not None:
+        chunk_size = size
+    if num != n_threads and _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    n_threads = max(int(num), 1)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(n_threads)
+    return _pool
+
+
+def elementwise(n_out=None):
+    """
+    Decorator of functions fun(*args, out=None) elementwise in their array
+    arguments, all of the same shape, other arguments are scalars.
+    Functions without out argument are supported too.
+
+    :param n_out: number of outputs stacked along the first axis of the
+        result, None for single output
+    """
+    def decorator(fun):
+        has_out = "out" in inspect.signature(fun).parameters
+
+        @functools.wraps(fun)
+        def chunked_fun(*args, out=None):
+            shape = next((nm.shape(arg) for arg in args if nm.ndim(arg)),
+                         ())
+            size = int(nm.prod(shape))
+            if (n_threads == 1 or size < 2 * chunk_size
+                    or (out is not None and not out.flags.c_contiguous)):
+                if has_out:
+                    return fun(*args, out=out)
+                res = fun(*args)
+                if out is None:
+                    return res
+                out[...] = res
+                return out
+
+            if out is None:
+                out = nm.empty(shape if n_out is None else (n_out,) + shape)
+            flat_args = [nm.ravel(arg) if nm.ndim(arg) else arg
+                         for arg in args]
+            flat_out = out.reshape((-1, size) if n_out else (size,))
+
+            def eval_chunk(start):
+                sl = slice(start, start + chunk_size)
+                chunk_args = [arg[sl] if nm.ndim(arg) else arg
+                              for arg in flat_args]
+                if has_out:
+                    fun(*chunk_args, out=flat_out[..., sl])
+                else:
+                    flat_out[..., sl] = fun(*chunk_args)
+
+            list(get_pool().map(eval_chunk, range(0, size, chunk_size)))
+            return out
+
+        return chunked_fun
+
+    return decorator
@@ -195,6 +195,6 @@ output("======================================")
 # ----------
 # | Plot 1D|
 # ----------
-from script.dg_plot_1D import load_and_plot_fun
+from dg_plot_1D import load_and_plot_fun
 
 load_and_plot_fun(output_folder, domain_name, t0, t1, min(tn, save_timestn), ic_fun)
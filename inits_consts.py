@@ -2,6 +2,73 @@
 """ Different initial conditions and environment constants as functions """
 import numpy as nm
 from scipy import signal
+import hashlib
+from collections import OrderedDict, namedtuple
+
+#---------------------------------------#
+#   Single pass piecewise functions     #
+#---------------------------------------#
+class PiecewiseFunction(object):
+    """
+    Piecewise function of x given by sorted breakpoints, evaluated in one
+    pass: x is bucketed into the intervals once and every piece is
+    evaluated only on the points of its interval, written directly to
+    preallocated output. Unlike nm.piecewise no masks per condition are
+    built and pieces are not evaluated on the whole x.
+    """
+
+    def __init__(self, breaks, pieces):
+        """
+        :param breaks: sorted breakpoints, pairs (value, side) with side
+            "left" if the value belongs to the piece on the left of it
+            and "right" if it belongs to the piece on the right
+        :param pieces: len(breaks) + 1 constants or functions of x
+        """
+        if len(pieces) != len(breaks) + 1:
+            raise ValueError("{} pieces needed for {} breakpoints"
+                             .format(len(breaks) + 1, len(breaks)))
+        self.breaks = breaks
+        self.pieces = pieces
+
+    def get_bounds(self, xf):
+        """
+        Returns start indices of the pieces in sorted xf.
+        """
+        # side of searchsorted giving the first index right of breakpoint
+        return [0] + [nm.searchsorted(xf, val,
+                                      "right" if side == "left" else "left")
+                      for val, side in self.breaks] + [len(xf)]
+
+    def __call__(self, x, out=None):
+        x = nm.asarray(x, dtype=nm.float64)
+        xf = x.ravel()
+        if out is None:
+            out = nm.empty(x.shape)
+        outf = out.reshape(-1)
+
+        if nm.all(xf[1:] >= xf[:-1]):
+            order = None
+            bounds = self.get_bounds(xf)
+        else:
+            # bucket into intervals, stable sort of small ints is radix sort
+            ipiece = nm.zeros(len(xf), dtype=nm.int16)
+            for val, side in self.breaks:
+                ipiece += (xf > val) if side == "left" else (xf >= val)
+            order = nm.argsort(ipiece, kind="stable")
+            bounds = nm.concatenate(
+                ([0], nm.cumsum(nm.bincount(ipiece,
+                                            minlength=len(self.pieces)))))
+
+        for piece, start, stop in zip(self.pieces, bounds[:-1], bounds[1:]):
+            if start == stop:
+                continue
+            if order is None:
+                ii = slice(start, stop)
+            else:
+                ii = order[start:stop]
+            outf[ii] = piece(xf[ii]) if callable(piece) else piece
+        return out
+
 
 #---------------------------------------#
 #   Some useful piecewise functions     #
@@ -18,8 +85,12 @@ def left_par_q(x):
     :param x:
     :return:
     """
-    return nm.piecewise(x, [x < a, 0.1 <= x , 0.3 < x],
-                           [0, lambda t: -100*(t - 0.1) * (t - 0.3), 0])
+    return _left_par_q(x)
+
+
+_left_par_q = PiecewiseFunction(
+    [(0.1, "right"), (0.3, "left")],
+    [0, lambda t: -100*(t - 0.1) * (t - 0.3), 0])
 
 
 def right_par_q(x):
@@ -30,13 +101,21 @@ def right_par_q(x):
     :param x:
     :return:
     """
-    return nm.piecewise(x, [x < b - .2, b - .2 <= x,  b < x],
-                           [0, lambda t: -100*(t - b) * (t - (b - .2)), 0])
+    return _right_par_q(x)
+
+
+_right_par_q = PiecewiseFunction(
+    [(b - .2, "right"), (b, "left")],
+    [0, lambda t: -100*(t - b) * (t - (b - .2)), 0])
 
 
 def middle_par_q(x):
-    return nm.piecewise(x, [x <= a, x <= a + .3, a + .3 < x, a + .4 <= x],
-                           [0, 0, lambda t: -100*(t - (a + .4)) * (t - (a + .3)), 0])
+    return _middle_par_q(x)
+
+
+_middle_par_q = PiecewiseFunction(
+    [(a + .3, "left"), (a + .4, "right")],
+    [0, lambda t: -100*(t - (a + .4)) * (t - (a + .3)), 0])
 
 
 def left_cos(x):
@@ -45,8 +124,12 @@ def left_cos(x):
     :param x:
     :return:
     """
-    return nm.piecewise(x, [x <= a, x <= a + .3, a + .3 < x, a + .4 <= x],
-                        [0, 0, lambda t: (nm.cos(nm.pi * 20 * (t - .35)) + 1) / 2, 0])
+    return _left_cos(x)
+
+
+_left_cos = PiecewiseFunction(
+    [(a + .3, "left"), (a + .4, "right")],
+    [0, lambda t: (nm.cos(nm.pi * 20 * (t - .35)) + 1) / 2, 0])
 
 
 #----------------------------------#
@@ -58,28 +141,42 @@ def three_step_q(x):
     :param x:
     :return:
     """
-    return nm.piecewise(x, [x <= a, x <= a + .5, a + .5 < x], [0, 1, 0])
+    return _three_step_q(x)
+
+
+_three_step_q = PiecewiseFunction([(a + .5, "left")], [1, 0])
 
 
 def three_step_u(x):
     """
     piecewise constant (-inf, a],(a, a + 5](a+5, inf)
     """
-    return nm.piecewise(x, [x <= 0, x <= .7, .7 < x], [0, .5, 2])
+    return _three_step_u(x)
+
+
+_three_step_u = PiecewiseFunction([(.7, "left")], [.5, 2])
 
 
 def four_step_u(x):
     """
     piecewise constant (-inf, 1.8],(1.8, a + 4](a+4, a + 5](a + 5, inf)
     """
-    return nm.piecewise(x, [x <= a, x <= a + .4, a + .4 < x, a + .5 <= x], [0, 0, .5, 0])
+    return _four_step_u(x)
+
+
+_four_step_u = PiecewiseFunction([(a + .4, "left"), (a + .5, "right")],
+                                 [0, .5, 0])
 
 
 def four_step_q(x):
     """
     piecewise constant (-inf, 1.8],(1.8, a + 4](a+4, a + 5](a + 5, inf)
     """
-    return nm.piecewise(x, [x <= a, x <= a + .4, a + .4 < x, a + .5 <= x], [0, 0, 1, 0])
+    return _four_step_q(x)
+
+
+_four_step_q = PiecewiseFunction([(a + .4, "left"), (a + .5, "right")],
+                                 [0, 1, 0])
 
 #------------------------#
 #   Constant functions   #
@@ -121,14 +218,22 @@ def gsmooth(x):
     nm.piecewise(x, [x[:, 0] <= - 1, x[:, 0] >= -1, 1 < x[:, 0]],
                          [0, lambda x: nm.exp(1 / (x ** 2 - 1)), 0])
     """
-    return  .3 * nm.piecewise(x, [x <= 0.1, x >= 0.1, .3 < x],
-                                 [0, lambda x: nm.exp(1/((10*(x - .2))**2 - 1) + 1), 0])
+    return _gsmooth(x)
+
+
+_gsmooth = PiecewiseFunction(
+    [(0.1, "right"), (.3, "left")],
+    [0, lambda x: .3 * nm.exp(1/((10*(x - .2))**2 - 1) + 1), 0])
 
 
 def superic(x):
     """
     All the initial conditions for the price of one, yayy!
     """
+    return _superic(x)
+
+
+def _get_superic():
     delta = 0.005
     beta = nm.log(4) / (36 * delta ** 2)
     alpha = 25
@@ -137,12 +242,23 @@ def superic(x):
     ex = lambda x, y: nm.exp(- beta * (x - y) ** 2)
     F = lambda x, y: nm.sqrt(nm.maximum(1 - alpha ** 2 * (x - y) ** 2, 0))
 
-    return (0 * ((x >= 0) & (x < 0.1)) +
-            0.5 / 6 * (ex(x, z - delta) + ex(x, z + delta) + 4 * ex(x, z)) * ((x >= 0.1) & (x < 0.2)) +
-            0.5 * ((x >= 0.3) & (x < 0.4)) +
-            (0.5 - abs(10 * (x - 0.55))) * ((x >= 0.5) & (x < 0.6)) +
-            # 0.5 / 6 * (F(x, b - delta) + F(x, b + delta) + 4 * F(x, b)) * ((x >= 0.7) & (x < 0.8)))
-            -200 * (x - .8) * (x - .7) * ((x >= .7) & (x <= .8)))
+    return PiecewiseFunction(
+        [(0.1, "right"), (0.2, "right"), (0.3, "right"), (0.4, "right"),
+         (0.5, "right"), (0.6, "right"), (0.7, "right"), (0.8, "left")],
+        [0,
+         lambda x: 0.5 / 6 * (ex(x, z - delta) + ex(x, z + delta)
+                              + 4 * ex(x, z)),
+         0,
+         0.5,
+         0,
+         lambda x: 0.5 - abs(10 * (x - 0.55)),
+         0,
+         # lambda x: 0.5 / 6 * (F(x, b - delta) + F(x, b + delta) + 4 * F(x, b)),
+         lambda x: -200 * (x - .8) * (x - .7),
+         0])
+
+
+_superic = _get_superic()
 
 
 #----------------------------------#
@@ -158,17 +274,25 @@ def sawtooth_q(x):
 #        Sinus and constant        #
 #----------------------------------#
 def cos_const_q(x):
-    return nm.piecewise(x, [x <= a + .3, a + .3 < x, a + .35 < x, a + .45 < x, a + .5 <= x],
-                        [0, lambda t: (nm.cos(nm.pi * 20 * (t - .35)) + 1) / 2, 1,
-                            lambda t: (nm.cos(nm.pi * 20 * (t - .45)) + 1) / 2, 0])
+    return _cos_const_q(x)
+
+
+_cos_const_q = PiecewiseFunction(
+    [(a + .3, "left"), (a + .35, "left"), (a + .45, "left"), (a + .5, "right")],
+    [0, lambda t: (nm.cos(nm.pi * 20 * (t - .35)) + 1) / 2, 1,
+        lambda t: (nm.cos(nm.pi * 20 * (t - .45)) + 1) / 2, 0])
 
 #----------------------------------#
 #   Quadratic and cubic function   #
 #----------------------------------#
 def quadr_cub(x):
-    return nm.piecewise(x, [x <= a + .1, a + .1 < x, a + .3 < x, a + .4 <= x],
-                        [0, lambda t: -25*(t - 0.1) * (t - 0.5),
-                            lambda t: -250*(t - 0.1) * (t - 0.1) * (t-0.4), 0])
+    return _quadr_cub(x)
+
+
+_quadr_cub = PiecewiseFunction(
+    [(a + .1, "left"), (a + .3, "left"), (a + .4, "right")],
+    [0, lambda t: -25*(t - 0.1) * (t - 0.5),
+        lambda t: -250*(t - 0.1) * (t - 0.1) * (t-0.4), 0])
 
 
 #-------------------------#
@@ -186,8 +310,8 @@ def wsysinit(x):
     """
     transformed innitial value for noncnons system solver
     """
-    return nm.stack((nm.sum(invRfunc(x)[:, 0, :] * gauss_init(x), 1),
-                     nm.sum(invRfunc(x)[:, 1, :] * gauss_init(x), 1)), 1)
+    invR = acoustic_system(x).invR
+    return nm.sum(invR, 2) * gauss_init(nm.ravel(x))[:, None]
 
 
 #---------------------------------------#
@@ -201,14 +325,20 @@ def Kfunc(x):
     """
     bulk modulus function
     """
-    return nm.piecewise(x, [x <= 0, x <= 5, 5 < x], [1, 1, 1])
+    return _Kfunc(x)
+
+
+_Kfunc = PiecewiseFunction([], [1])
 
 
 def rhofunc(x):
     """
     density function
     """
-    return nm.piecewise(x, [x <= 0, x > 0], [1, 4])
+    return _rhofunc(x)
+
+
+_rhofunc = PiecewiseFunction([(0, "left")], [1, 4])
 
 
 def cfunc(x):
@@ -225,14 +355,91 @@ def Zfunc(x):
     return nm.sqrt(Kfunc(x) * rhofunc(x))
 
 
+SystemCoefs = namedtuple("SystemCoefs", ["A", "AT", "eigA", "R", "invR"])
+
+
+class AcousticSystem(object):
+    """
+    Coefficients of the acoustic system given by bulk modulus K(x) and
+    density rho(x), all matrices are evaluated at once into views of
+    single (5, n, 2, 2) buffer. Buffers are cached per coordinate array
+    and are read only.
+    """
+
+    def __init__(self, K=None, rho=None, maxsize=8):
+        """
+        :param K: bulk modulus function, Kfunc if None
+        :param rho: density function, rhofunc if None
+        :param maxsize: max. number of cached coordinate arrays
+        """
+        self.K = Kfunc if K is None else K
+        self.rho = rhofunc if rho is None else rho
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+
+    def evaluate(self, x, out=None):
+        """
+        :param x: coordinates, flattened
+        :param out: buffer of shape (5, n, 2, 2)
+        :return: SystemCoefs of A, A^T, eigenvalues of A as diagonal
+            matrix, R and R^-1, each of shape (n, 2, 2)
+        """
+        x = nm.ravel(nm.asarray(x, dtype=nm.float64))
+        if out is None:
+            out = nm.zeros((5, len(x), 2, 2))
+        else:
+            out[...] = 0
+        A, AT, eigA, R, invR = out
+        K = self.K(x)
+        rho = self.rho(x)
+
+        A[:, 0, 1] = K
+        nm.divide(1., rho, out=A[:, 1, 0])
+        AT[:, 0, 1] = A[:, 1, 0]
+        AT[:, 1, 0] = K
+
+        c = eigA[:, 1, 1]
+        nm.divide(K, rho, out=c)
+        nm.sqrt(c, out=c)
+        nm.negative(c, out=eigA[:, 0, 0])
+
+        Z = R[:, 0, 1]
+        nm.multiply(K, rho, out=Z)
+        nm.sqrt(Z, out=Z)
+        nm.negative(Z, out=R[:, 0, 0])
+        R[:, 1, :] = 1
+
+        nm.divide(-.5, Z, out=invR[:, 0, 0])
+        invR[:, 0, 1] = invR[:, 0, 0]
+        invR[:, 1, :] = .5
+        return SystemCoefs(A, AT, eigA, R, invR)
+
+    def __call__(self, x):
+        x = nm.ascontiguousarray(x, dtype=nm.float64)
+        key = x.shape, hashlib.blake2b(x, digest_size=16).digest()
+        coefs = self.cache.get(key)
+        if coefs is None:
+            coefs = self.evaluate(x)
+            for mtx in coefs:
+                mtx.flags.writeable = False
+            self.cache[key] = coefs
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return coefs
+
+
+acoustic_system = AcousticSystem()
+
+
 def Afunc(x):
     """
     enviroment matrix
     A(x) =  [   0    , K(x) ]
             [1/rho(x),  0   ]
     """
-    return nm.array([[nm.zeros(len(x)), 1 / rhofunc(x)],
-                     [Kfunc(x), nm.zeros(len(x))]]).swapaxes(0, 2)
+    return acoustic_system(x).A
 
 
 def ATfunc(x):
@@ -240,31 +447,28 @@ def ATfunc(x):
     transposed enviroment matrix,
     for adjoint conservative system
     """
-    return nm.transpose(Afunc(x), (0, 2, 1))
+    return acoustic_system(x).AT
 
 
 def eigAfunc(x):
     """
     Jordan shape of A
     """
-    return nm.array([[-cfunc(x), nm.zeros(len(x))],
-                     [nm.zeros(len(x)), cfunc(x)]]).swapaxes(0, 2)
+    return acoustic_system(x).eigA
 
 
 def Rfunc(x):
     """
     eigen vectors of A
     """
-    return nm.array([[-Zfunc(x), nm.ones(len(x))],
-                     [Zfunc(x), nm.ones(len(x))]]).swapaxes(0, 2)
+    return acoustic_system(x).R
 
 
 def invRfunc(x):
     """
     inverse egigen vectors of A
     """
-    return nm.array([[-1 / (2 * Zfunc(x)), nm.ones(len(x)) / 2],
-                     [-1 / (2 * Zfunc(x)), nm.ones(len(x)) / 2]]).swapaxes(0, 2)
+    return acoustic_system(x).invR
 
 
 if __name__ == '__main__':
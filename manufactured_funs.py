@@ -0,0 +1,785 @@
+"""
+Manufactured solution functions generated by msfun_codegen.py, do not edit.
+"""
+import threading
+
+import numpy as nm
+
+from expr_backend import elementwise
+
+_work_cache = {}
+
+
+def _get_work(name, n_work, shape):
+    """
+    Returns work buffers of function name for arrays of given shape,
+    the buffers are kept for next calls with the same shape in the same
+    thread.
+    """
+    key = (name, shape, threading.get_ident())
+    work = _work_cache.get(key)
+    if work is None:
+        if len(_work_cache) > 64:
+            _work_cache.clear()
+        work = _work_cache[key] = [nm.empty(shape) for ii in range(n_work)]
+    return work
+
+
+@elementwise()
+def quarteroni2_sol(x_1, x_2, eps, out=None):
+    """Quarteroni 2 solution."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni2_sol', 2, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.multiply(x_2, 2.0, out=work[1])
+    nm.add(work[1], -1.0, out=work[1])
+    nm.square(work[1], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.add(work[0], work[1], out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    s1 = (1/16)/nm.sqrt(eps)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.arctan(work[0], out=work[0])
+    nm.negative(work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni2_sol_grad(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 2 solution."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni2_sol_grad', 4, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.multiply(x_2, 2.0, out=work[2])
+    nm.add(work[2], -1.0, out=work[2])
+    nm.square(work[2], out=work[3])
+    nm.multiply(work[3], 4.0, out=work[3])
+    nm.add(work[1], work[3], out=work[1])
+    nm.add(work[1], -1.0, out=work[1])
+    nm.square(work[1], out=work[1])
+    s1 = (1/256)/eps
+    nm.multiply(work[1], s1, out=work[1])
+    nm.add(work[1], 1.0, out=work[1])
+    s2 = -1/nm.sqrt(eps)
+    nm.divide(s2, work[1], out=out[0])
+    nm.multiply(out[0], work[0], out=out[0])
+    nm.divide(s2, work[1], out=out[1])
+    nm.multiply(out[1], work[2], out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni2_source(x_1, x_2, eps, out=None):
+    """Quarteroni 2 source."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni2_source', 6, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[2])
+    nm.multiply(x_2, 2.0, out=work[3])
+    nm.add(work[3], -1.0, out=work[3])
+    nm.square(work[3], out=work[4])
+    nm.multiply(work[4], 4.0, out=work[5])
+    nm.add(work[2], work[5], out=work[2])
+    nm.add(work[2], -1.0, out=work[2])
+    nm.square(work[2], out=work[5])
+    s1 = eps**(-1.0)
+    nm.multiply(work[5], s1, out=work[5])
+    nm.add(work[5], 256.0, out=work[5])
+    s2 = 1/nm.sqrt(eps)
+    nm.multiply(work[0], s2, out=work[0])
+    nm.multiply(work[3], s2, out=work[3])
+    nm.divide(work[1], work[5], out=work[1])
+    nm.multiply(work[1], work[2], out=work[1])
+    s3 = 8/eps
+    nm.multiply(work[1], s3, out=work[1])
+    nm.divide(work[4], work[5], out=work[4])
+    nm.multiply(work[4], work[2], out=work[4])
+    nm.multiply(work[4], s3, out=work[4])
+    nm.negative(work[1], out=work[1])
+    nm.subtract(work[1], work[4], out=work[1])
+    nm.add(work[1], 1.0, out=work[1])
+    s4 = 4*nm.sqrt(eps)
+    nm.multiply(work[1], s4, out=work[1])
+    nm.negative(work[0], out=work[0])
+    nm.subtract(work[0], work[3], out=work[0])
+    nm.add(work[0], work[1], out=work[0])
+    nm.divide(256.0, work[5], out=out)
+    nm.multiply(out, work[0], out=out)
+    return out
+
+
+@elementwise()
+def quarteroni2_bc_left(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 2 solution on left boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni2_bc_left', 1, shape)
+    nm.multiply(x_2, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.add(work[0], 3.0, out=work[0])
+    s1 = (1/16)/nm.sqrt(eps)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.arctan(work[0], out=work[0])
+    nm.negative(work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni2_bc_grad_left(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 2 solution on left boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni2_bc_grad_left', 2, shape)
+    nm.multiply(x_2, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.add(work[1], 3.0, out=work[1])
+    nm.square(work[1], out=work[1])
+    s1 = (1/256)/eps
+    nm.multiply(work[1], s1, out=work[1])
+    nm.add(work[1], 1.0, out=work[1])
+    s2 = 1/nm.sqrt(eps)
+    nm.divide(s2, work[1], out=out[0])
+    s3 = -1/nm.sqrt(eps)
+    nm.divide(s3, work[1], out=out[1])
+    nm.multiply(out[1], work[0], out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni2_bc_right(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 2 solution on right boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni2_bc_right', 1, shape)
+    nm.multiply(x_2, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.add(work[0], 3.0, out=work[0])
+    s1 = (1/16)/nm.sqrt(eps)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.arctan(work[0], out=work[0])
+    nm.negative(work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni2_bc_grad_right(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 2 solution on right boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni2_bc_grad_right', 2, shape)
+    nm.multiply(x_2, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.add(work[1], 3.0, out=work[1])
+    nm.square(work[1], out=work[1])
+    s1 = (1/256)/eps
+    nm.multiply(work[1], s1, out=work[1])
+    nm.add(work[1], 1.0, out=work[1])
+    s2 = -1/nm.sqrt(eps)
+    nm.divide(s2, work[1], out=out[0])
+    nm.divide(s2, work[1], out=out[1])
+    nm.multiply(out[1], work[0], out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni2_bc_bottom(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 2 solution on bottom boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni2_bc_bottom', 1, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.add(work[0], 3.0, out=work[0])
+    s1 = (1/16)/nm.sqrt(eps)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.arctan(work[0], out=work[0])
+    nm.negative(work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni2_bc_grad_bottom(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 2 solution on bottom boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni2_bc_grad_bottom', 2, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.add(work[1], 3.0, out=work[1])
+    nm.square(work[1], out=work[1])
+    s1 = (1/256)/eps
+    nm.multiply(work[1], s1, out=work[1])
+    nm.add(work[1], 1.0, out=work[1])
+    s2 = -1/nm.sqrt(eps)
+    nm.divide(s2, work[1], out=out[0])
+    nm.multiply(out[0], work[0], out=out[0])
+    s3 = 1/nm.sqrt(eps)
+    nm.divide(s3, work[1], out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni2_bc_top(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 2 solution on top boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni2_bc_top', 1, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.add(work[0], 3.0, out=work[0])
+    s1 = (1/16)/nm.sqrt(eps)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.arctan(work[0], out=work[0])
+    nm.negative(work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni2_bc_grad_top(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 2 solution on top boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni2_bc_grad_top', 2, shape)
+    nm.multiply(x_1, 2.0, out=work[0])
+    nm.add(work[0], -1.0, out=work[0])
+    nm.square(work[0], out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.add(work[1], 3.0, out=work[1])
+    nm.square(work[1], out=work[1])
+    s1 = (1/256)/eps
+    nm.multiply(work[1], s1, out=work[1])
+    nm.add(work[1], 1.0, out=work[1])
+    s2 = -1/nm.sqrt(eps)
+    nm.divide(s2, work[1], out=out[0])
+    nm.multiply(out[0], work[0], out=out[0])
+    nm.divide(s2, work[1], out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni3_sol(x_1, x_2, eps, out=None):
+    """Quarteroni 3 solution."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni3_sol', 3, shape)
+    nm.multiply(x_1, x_2, out=work[0])
+    nm.add(x_1, -1.0, out=work[1])
+    nm.add(x_2, -1.0, out=work[2])
+    nm.multiply(work[1], work[2], out=work[1])
+    s1 = -1/eps
+    nm.multiply(work[1], s1, out=work[1])
+    nm.exp(work[1], out=work[1])
+    s2 = -nm.exp(-1/eps)
+    nm.add(work[1], s2, out=work[1])
+    s3 = (1 - nm.exp(-1/eps))**(-1.0)
+    nm.multiply(work[1], s3, out=work[1])
+    nm.add(x_1, x_2, out=out)
+    nm.subtract(out, work[0], out=out)
+    nm.subtract(out, work[1], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni3_sol_grad(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 3 solution."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni3_sol_grad', 3, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    nm.add(x_1, -1.0, out=work[1])
+    nm.multiply(work[1], work[0], out=work[2])
+    s1 = -1/eps
+    nm.multiply(work[2], s1, out=work[2])
+    nm.exp(work[2], out=work[2])
+    nm.multiply(work[0], work[2], out=work[0])
+    s2 = 1/(eps*(1 - nm.exp(-1/eps)))
+    nm.multiply(work[0], s2, out=work[0])
+    nm.negative(x_2, out=out[0])
+    nm.add(out[0], work[0], out=out[0])
+    nm.add(out[0], 1.0, out=out[0])
+    nm.multiply(work[1], work[2], out=work[1])
+    nm.multiply(work[1], s2, out=work[1])
+    nm.negative(x_1, out=out[1])
+    nm.add(out[1], work[1], out=out[1])
+    nm.add(out[1], 1.0, out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni3_source(x_1, x_2, eps, out=None):
+    """Quarteroni 3 source."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni3_source', 5, shape)
+    nm.add(x_1, -1.0, out=work[0])
+    nm.add(x_2, -1.0, out=work[1])
+    nm.multiply(work[0], work[1], out=work[2])
+    s1 = -1/eps
+    nm.multiply(work[2], s1, out=work[2])
+    nm.exp(work[2], out=work[2])
+    nm.multiply(work[0], work[2], out=work[3])
+    s2 = 1/(eps*(1 - nm.exp(-1/eps)))
+    nm.multiply(work[3], s2, out=work[3])
+    nm.multiply(work[1], work[2], out=work[4])
+    nm.multiply(work[4], s2, out=work[4])
+    nm.square(work[0], out=work[0])
+    nm.square(work[1], out=work[1])
+    nm.add(work[0], work[1], out=work[0])
+    nm.multiply(work[0], work[2], out=work[0])
+    nm.multiply(work[0], s2, out=work[0])
+    nm.negative(x_1, out=out)
+    nm.subtract(out, x_2, out=out)
+    nm.add(out, work[3], out=out)
+    nm.add(out, work[4], out=out)
+    nm.add(out, work[0], out=out)
+    nm.add(out, 2.0, out=out)
+    return out
+
+
+@elementwise()
+def quarteroni3_bc_left(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 3 solution on left boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni3_bc_left', 1, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    s1 = eps**(-1.0)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.exp(work[0], out=work[0])
+    s2 = -nm.exp(-1/eps)
+    nm.add(work[0], s2, out=work[0])
+    s3 = (1 - nm.exp(-1/eps))**(-1.0)
+    nm.multiply(work[0], s3, out=work[0])
+    nm.subtract(x_2, work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni3_bc_grad_left(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 3 solution on left boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni3_bc_grad_left', 2, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    s1 = eps**(-1.0)
+    nm.multiply(work[0], s1, out=work[1])
+    nm.exp(work[1], out=work[1])
+    nm.multiply(work[0], work[1], out=work[0])
+    s2 = 1/(eps*(1 - nm.exp(-1/eps)))
+    nm.multiply(work[0], s2, out=work[0])
+    nm.negative(x_2, out=out[0])
+    nm.add(out[0], work[0], out=out[0])
+    nm.add(out[0], 1.0, out=out[0])
+    nm.multiply(work[1], s2, out=work[1])
+    nm.negative(work[1], out=out[1])
+    nm.add(out[1], 1.0, out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni3_bc_right(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 3 solution on right boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    out[...] = 0.0
+    return out
+
+
+@elementwise(2)
+def quarteroni3_bc_grad_right(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 3 solution on right boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni3_bc_grad_right', 1, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    s1 = 1/(eps*(1 - nm.exp(-1/eps)))
+    nm.multiply(work[0], s1, out=work[0])
+    nm.negative(x_2, out=out[0])
+    nm.add(out[0], work[0], out=out[0])
+    nm.add(out[0], 1.0, out=out[0])
+    out[1][...] = 0.0
+    return out
+
+
+@elementwise()
+def quarteroni3_bc_bottom(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 3 solution on bottom boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('quarteroni3_bc_bottom', 1, shape)
+    nm.add(x_1, -1.0, out=work[0])
+    s1 = eps**(-1.0)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.exp(work[0], out=work[0])
+    s2 = -nm.exp(-1/eps)
+    nm.add(work[0], s2, out=work[0])
+    s3 = (1 - nm.exp(-1/eps))**(-1.0)
+    nm.multiply(work[0], s3, out=work[0])
+    nm.subtract(x_1, work[0], out=out)
+    return out
+
+
+@elementwise(2)
+def quarteroni3_bc_grad_bottom(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 3 solution on bottom boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni3_bc_grad_bottom', 3, shape)
+    nm.add(x_1, -1.0, out=work[0])
+    s1 = eps**(-1.0)
+    nm.multiply(work[0], s1, out=work[1])
+    nm.exp(work[1], out=work[1])
+    s2 = 1/(eps*(1 - nm.exp(-1/eps)))
+    nm.multiply(work[1], s2, out=work[2])
+    nm.negative(work[2], out=out[0])
+    nm.add(out[0], 1.0, out=out[0])
+    nm.multiply(work[0], work[1], out=work[0])
+    nm.multiply(work[0], s2, out=work[0])
+    nm.negative(x_1, out=out[1])
+    nm.add(out[1], work[0], out=out[1])
+    nm.add(out[1], 1.0, out=out[1])
+    return out
+
+
+@elementwise()
+def quarteroni3_bc_top(x_1, x_2, eps, out=None):
+    """Value of Quarteroni 3 solution on top boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    out[...] = 0.0
+    return out
+
+
+@elementwise(2)
+def quarteroni3_bc_grad_top(x_1, x_2, eps, out=None):
+    """Gradient of Quarteroni 3 solution on top boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('quarteroni3_bc_grad_top', 1, shape)
+    out[0][...] = 0.0
+    nm.add(x_1, -1.0, out=work[0])
+    s1 = 1/(eps*(1 - nm.exp(-1/eps)))
+    nm.multiply(work[0], s1, out=work[0])
+    nm.negative(x_1, out=out[1])
+    nm.add(out[1], work[0], out=out[1])
+    nm.add(out[1], 1.0, out=out[1])
+    return out
+
+
+@elementwise()
+def kucera_sol(x_1, x_2, t, out=None):
+    """Kucera solution."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('kucera_sol', 4, shape)
+    nm.multiply(x_1, x_2, out=work[0])
+    nm.multiply(work[0], 5.0, out=work[0])
+    nm.sin(work[0], out=work[0])
+    nm.multiply(x_1, 4.0, out=work[1])
+    nm.multiply(x_2, 4.0, out=work[2])
+    nm.multiply(x_1, x_2, out=work[3])
+    nm.multiply(work[3], 4.0, out=work[3])
+    nm.add(work[1], work[2], out=work[1])
+    nm.subtract(work[1], work[3], out=work[1])
+    nm.sin(work[1], out=work[1])
+    nm.add(work[0], work[1], out=work[0])
+    s1 = 1 - nm.exp(-t)
+    nm.multiply(work[0], s1, out=out)
+    return out
+
+
+@elementwise(2)
+def kucera_sol_grad(x_1, x_2, t, out=None):
+    """Gradient of Kucera solution."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('kucera_sol_grad', 4, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    nm.multiply(x_1, 4.0, out=work[1])
+    nm.multiply(x_2, 4.0, out=work[2])
+    nm.multiply(x_1, x_2, out=work[3])
+    nm.multiply(work[3], 4.0, out=work[3])
+    nm.add(work[1], work[2], out=work[1])
+    nm.subtract(work[1], work[3], out=work[1])
+    nm.cos(work[1], out=work[1])
+    nm.multiply(work[0], work[1], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.multiply(x_1, x_2, out=work[3])
+    nm.multiply(work[3], 5.0, out=work[3])
+    nm.cos(work[3], out=work[3])
+    nm.multiply(x_2, work[3], out=work[2])
+    nm.multiply(work[2], 5.0, out=work[2])
+    nm.negative(work[0], out=work[0])
+    nm.add(work[0], work[2], out=work[0])
+    s1 = 1 - nm.exp(-t)
+    nm.multiply(work[0], s1, out=out[0])
+    nm.add(x_1, -1.0, out=work[0])
+    nm.multiply(work[0], work[1], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.multiply(x_1, work[3], out=work[1])
+    nm.multiply(work[1], 5.0, out=work[1])
+    nm.negative(work[0], out=work[0])
+    nm.add(work[0], work[1], out=work[0])
+    nm.multiply(work[0], s1, out=out[1])
+    return out
+
+
+@elementwise(3)
+def kucera_space_source(x_1, x_2, eps, out=None):
+    """Spatial factors of Kucera source."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((3,) + shape)
+    work = _get_work('kucera_space_source', 9, shape)
+    nm.multiply(x_1, x_2, out=work[0])
+    nm.multiply(work[0], 5.0, out=work[0])
+    nm.sin(work[0], out=work[1])
+    nm.multiply(x_1, 4.0, out=work[2])
+    nm.multiply(x_2, 4.0, out=work[3])
+    nm.multiply(x_1, x_2, out=work[4])
+    nm.multiply(work[4], 4.0, out=work[4])
+    nm.add(work[2], work[3], out=work[2])
+    nm.subtract(work[2], work[4], out=work[2])
+    nm.sin(work[2], out=work[4])
+    nm.add(work[1], work[4], out=out[0])
+    nm.add(x_1, -1.0, out=work[3])
+    nm.cos(work[2], out=work[2])
+    nm.multiply(work[3], work[2], out=work[5])
+    nm.multiply(work[5], 4.0, out=work[5])
+    nm.add(x_2, -1.0, out=work[6])
+    nm.multiply(work[6], work[2], out=work[7])
+    nm.multiply(work[7], 4.0, out=work[7])
+    nm.cos(work[0], out=work[0])
+    nm.multiply(x_1, work[0], out=work[2])
+    nm.multiply(work[2], 5.0, out=work[2])
+    nm.multiply(x_2, work[0], out=work[8])
+    nm.multiply(work[8], 5.0, out=work[8])
+    nm.negative(work[5], out=work[5])
+    nm.subtract(work[5], work[7], out=work[5])
+    nm.add(work[5], work[2], out=work[5])
+    nm.add(work[5], work[8], out=work[5])
+    nm.multiply(out[0], work[5], out=out[1])
+    nm.square(work[3], out=work[3])
+    nm.multiply(work[3], work[4], out=work[3])
+    nm.multiply(work[3], 16.0, out=work[3])
+    nm.square(work[6], out=work[6])
+    nm.multiply(work[6], work[4], out=work[6])
+    nm.multiply(work[6], 16.0, out=work[6])
+    nm.square(x_1, out=work[4])
+    nm.multiply(work[4], work[1], out=work[4])
+    nm.multiply(work[4], 25.0, out=work[4])
+    nm.square(x_2, out=work[5])
+    nm.multiply(work[5], work[1], out=work[5])
+    nm.multiply(work[5], 25.0, out=work[5])
+    nm.add(work[3], work[6], out=work[3])
+    nm.add(work[3], work[4], out=work[3])
+    nm.add(work[3], work[5], out=work[3])
+    nm.multiply(work[3], eps, out=out[2])
+    return out
+
+
+@elementwise()
+def kucera_space_bc_left(x_1, x_2, out=None):
+    """Value of spatial factor of Kucera solution on left boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('kucera_space_bc_left', 2, shape)
+    nm.multiply(x_2, 5.0, out=work[0])
+    nm.sin(work[0], out=work[0])
+    nm.multiply(x_2, 2.0, out=work[1])
+    nm.add(work[1], -1.0, out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.sin(work[1], out=work[1])
+    nm.negative(work[0], out=out)
+    nm.add(out, work[1], out=out)
+    return out
+
+
+@elementwise(2)
+def kucera_space_bc_grad_left(x_1, x_2, out=None):
+    """Gradient of spatial factor of Kucera solution on left boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('kucera_space_bc_grad_left', 4, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    nm.multiply(x_2, 2.0, out=work[1])
+    nm.add(work[1], -1.0, out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.cos(work[1], out=work[1])
+    nm.multiply(work[0], work[1], out=work[0])
+    nm.multiply(work[0], 4.0, out=work[0])
+    nm.multiply(x_2, 5.0, out=work[2])
+    nm.cos(work[2], out=work[2])
+    nm.multiply(x_2, work[2], out=work[3])
+    nm.multiply(work[3], 5.0, out=work[3])
+    nm.negative(work[0], out=out[0])
+    nm.add(out[0], work[3], out=out[0])
+    nm.multiply(work[2], 5.0, out=work[2])
+    nm.multiply(work[1], 8.0, out=work[1])
+    nm.negative(work[2], out=out[1])
+    nm.add(out[1], work[1], out=out[1])
+    return out
+
+
+@elementwise()
+def kucera_space_bc_right(x_1, x_2, out=None):
+    """Value of spatial factor of Kucera solution on right boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('kucera_space_bc_right', 1, shape)
+    nm.multiply(x_2, 5.0, out=work[0])
+    nm.sin(work[0], out=work[0])
+    s1 = nm.sin(4)
+    nm.add(work[0], s1, out=out)
+    return out
+
+
+@elementwise(2)
+def kucera_space_bc_grad_right(x_1, x_2, out=None):
+    """Gradient of spatial factor of Kucera solution on right boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('kucera_space_bc_grad_right', 3, shape)
+    nm.add(x_2, -1.0, out=work[0])
+    s1 = 4*nm.cos(4)
+    nm.multiply(work[0], s1, out=work[0])
+    nm.multiply(x_2, 5.0, out=work[1])
+    nm.cos(work[1], out=work[1])
+    nm.multiply(x_2, work[1], out=work[2])
+    nm.multiply(work[2], 5.0, out=work[2])
+    nm.negative(work[0], out=out[0])
+    nm.add(out[0], work[2], out=out[0])
+    nm.multiply(work[1], 5.0, out=out[1])
+    return out
+
+
+@elementwise()
+def kucera_space_bc_bottom(x_1, x_2, out=None):
+    """Value of spatial factor of Kucera solution on bottom boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('kucera_space_bc_bottom', 2, shape)
+    nm.multiply(x_1, 5.0, out=work[0])
+    nm.sin(work[0], out=work[0])
+    nm.multiply(x_1, 2.0, out=work[1])
+    nm.add(work[1], -1.0, out=work[1])
+    nm.multiply(work[1], 4.0, out=work[1])
+    nm.sin(work[1], out=work[1])
+    nm.negative(work[0], out=out)
+    nm.add(out, work[1], out=out)
+    return out
+
+
+@elementwise(2)
+def kucera_space_bc_grad_bottom(x_1, x_2, out=None):
+    """Gradient of spatial factor of Kucera solution on bottom boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('kucera_space_bc_grad_bottom', 4, shape)
+    nm.multiply(x_1, 5.0, out=work[0])
+    nm.cos(work[0], out=work[0])
+    nm.multiply(work[0], 5.0, out=work[1])
+    nm.multiply(x_1, 2.0, out=work[2])
+    nm.add(work[2], -1.0, out=work[2])
+    nm.multiply(work[2], 4.0, out=work[2])
+    nm.cos(work[2], out=work[2])
+    nm.multiply(work[2], 8.0, out=work[3])
+    nm.negative(work[1], out=out[0])
+    nm.add(out[0], work[3], out=out[0])
+    nm.add(x_1, -1.0, out=work[3])
+    nm.multiply(work[3], work[2], out=work[3])
+    nm.multiply(work[3], 4.0, out=work[3])
+    nm.multiply(x_1, work[0], out=work[2])
+    nm.multiply(work[2], 5.0, out=work[2])
+    nm.negative(work[3], out=out[1])
+    nm.add(out[1], work[2], out=out[1])
+    return out
+
+
+@elementwise()
+def kucera_space_bc_top(x_1, x_2, out=None):
+    """Value of spatial factor of Kucera solution on top boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty(shape)
+    work = _get_work('kucera_space_bc_top', 1, shape)
+    nm.multiply(x_1, 5.0, out=work[0])
+    nm.sin(work[0], out=work[0])
+    s1 = nm.sin(4)
+    nm.add(work[0], s1, out=out)
+    return out
+
+
+@elementwise(2)
+def kucera_space_bc_grad_top(x_1, x_2, out=None):
+    """Gradient of spatial factor of Kucera solution on top boundary."""
+    shape = nm.shape(x_1)
+    if out is None:
+        out = nm.empty((2,) + shape)
+    work = _get_work('kucera_space_bc_grad_top', 3, shape)
+    nm.multiply(x_1, 5.0, out=work[0])
+    nm.cos(work[0], out=work[0])
+    nm.multiply(work[0], 5.0, out=out[0])
+    nm.add(x_1, -1.0, out=work[1])
+    s1 = 4*nm.cos(4)
+    nm.multiply(work[1], s1, out=work[1])
+    nm.multiply(x_1, work[0], out=work[2])
+    nm.multiply(work[2], 5.0, out=work[2])
+    nm.negative(work[1], out=out[1])
+    nm.add(out[1], work[2], out=out[1])
+    return out
@@ -0,0 +1,116 @@
+"""
+Cached hierarchy of uniformly refined meshes.
+
+Refinement level k is built from the cached level k - 1 and stored in numpy
+.npz files in a folder keyed by hash of the source mesh file, so repeated
+convergence studies on the same mesh do not refine it again.
+"""
+import os
+import hashlib
+from os.path import join as pjoin
+
+import numpy as nm
+
+from sfepy.base.base import output
+from sfepy.discrete.fem import Mesh, FEDomain
+from sfepy.discrete.fem.meshio import UserMeshIO
+
+from run_dg_utils import outputs_folder
+
+mesh_cache_folder = pjoin(outputs_folder, "mesh_cache")
+
+
+def get_file_hash(filename):
+    key = hashlib.sha1()
+    with open(filename, "rb") as f:
+        key.update(f.read())
+    return key.hexdigest()
+
+
+def save_mesh_npz(mesh, filename):
+    """
+    Saves mesh data to uncompressed .npz file, writes to temporary file
+    first so that concurrent readers never see partial file.
+    """
+    coors, ngroups, conns, mat_ids, descs = mesh._get_io_data()
+    arrays = {"coors": coors, "ngroups": ngroups,
+              "descs": nm.array(descs), "name": nm.array(mesh.name)}
+    for ii, (conn, mat_id) in enumerate(zip(conns, mat_ids)):
+        arrays["conn{}".format(ii)] = conn
+        arrays["mat_id{}".format(ii)] = mat_id
+
+    tmp_name = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp_name, "wb") as f:
+        nm.savez(f, **arrays)
+    os.replace(tmp_name, filename)
+
+
+def load_mesh_npz(filename):
+    with nm.load(filename) as data:
+        descs = [str(desc) for desc in data["descs"]]
+        conns = [data["conn{}".format(ii)] for ii in range(len(descs))]
+        mat_ids = [data["mat_id{}".format(ii)] for ii in range(len(descs))]
+        return Mesh.from_data(str(data["name"]), data["coors"],
+                              data["ngroups"], conns, mat_ids, descs)
+
+
+def is_cached_mesh(filename_mesh):
+    return isinstance(filename_mesh, str) and filename_mesh.endswith(".npz")
+
+
+def get_cached_mesh_hook(filename):
+    """
+    Returns mesh hook reading mesh cached in .npz file, usable as
+    filename_mesh in example define.
+    """
+    def mesh_hook(mesh, mode):
+        if mode == 'read':
+            return load_mesh_npz(filename)
+
+        elif mode == 'write':
+            pass
+
+    return UserMeshIO(mesh_hook)
+
+
+def get_refined_mesh(filename, level, cache_folder=mesh_cache_folder):
+    """
+    Returns file with mesh from filename uniformly refined level times.
+    Missing levels are built incrementally from the finest cached level.
+
+    :param filename: source mesh file
+    :param level: refinement level, for 0 filename is returned
+    :param cache_folder: folder with the cached hierarchies
+    :return: path to .npz file with the refined mesh
+    """
+    if level == 0:
+        return filename
+
+    hierarchy_folder = pjoin(cache_folder, get_file_hash(filename))
+    name = os.path.splitext(os.path.basename(filename))[0]
+
+    def level_file(lvl):
+        return pjoin(hierarchy_folder, "{}_r{}.npz".format(name, lvl))
+
+    cached_level = level
+    while cached_level > 0 and not os.path.isfile(level_file(cached_level)):
+        cached_level -= 1
+
+    if cached_level == level:
+        return level_file(level)
+
+    os.makedirs(hierarchy_folder, exist_ok=True)
+    if cached_level == 0:
+        mesh = Mesh.from_file(filename)
+    else:
+        mesh = load_mesh_npz(level_file(cached_level))
+
+    domain = FEDomain(mesh.name, mesh)
+    for lvl in range(cached_level + 1, level + 1):
+        output('refine {} to level {}...'.format(filename, lvl))
+        domain = domain.refine()
+        output('... %d nodes %d elements'
+               % (domain.shape.n_nod, domain.shape.n_el))
+        save_mesh_npz(domain.mesh, level_file(lvl))
+
+    return level_file(level)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Generator of NumPy functions evaluating manufactured solutions, their
+boundary values and gradients and the corresponding sources.
+
+The symbolic expressions are derived here from the analytic solutions as in
+the sage_ntbs notebooks, common subexpressions are eliminated by sympy.cse
+and the result is emitted as a sequence of NumPy ufunc calls writing into
+reused work buffers, so evaluation does not allocate a temporary array for
+every operation. The functions are decorated by expr_backend.elementwise,
+so they are evaluated on a thread pool when enabled. Running the script
+regenerates manufactured_funs.py.
+
+Requires sympy, which is needed only for the generation.
+"""
+import argparse
+import sys
+
+import sympy as sp
+from sympy.printing.numpy import NumPyPrinter
+
+x_1, x_2, t, eps = sp.symbols("x_1 x_2 t eps", real=True)
+
+ufuncs = {sp.sin: "sin", sp.cos: "cos", sp.exp: "exp", sp.atan: "arctan",
+          sp.tanh: "tanh", sp.log: "log", sp.Abs: "abs"}
+
+header = '''"""
+Manufactured solution functions generated by msfun_codegen.py, do not edit.
+"""
+import threading
+
+import numpy as nm
+
+from expr_backend import elementwise
+
+_work_cache = {}
+
+
+def _get_work(name, n_work, shape):
+    """
+    Returns work buffers of function name for arrays of given shape,
+    the buffers are kept for next calls with the same shape in the same
+    thread.
+    """
+    key = (name, shape, threading.get_ident())
+    work = _work_cache.get(key)
+    if work is None:
+        if len(_work_cache) > 64:
+            _work_cache.clear()
+        work = _work_cache[key] = [nm.empty(shape) for ii in range(n_work)]
+    return work
+'''
+
+
+class UfuncEmitter(object):
+    """
+    Emits three-address NumPy code for sympy expressions. Repeated
+    subexpressions are computed once, array values are kept in work
+    buffers which are reused as soon as the values are dead, values
+    depending only on scalar symbols are computed as Python scalars.
+    """
+
+    def __init__(self, scalar_syms):
+        self.scalar_syms = set(scalar_syms)
+        self.printer = NumPyPrinter()
+        self.lines = []
+        self.names = {}
+        self.refcounts = {}
+        self.buffers = {}
+        self.free = []
+        self.n_work = 0
+        self.n_scalar = 0
+
+    def is_scalar(self, expr):
+        return expr.free_symbols <= self.scalar_syms
+
+    @staticmethod
+    def is_reciprocal(expr):
+        return expr.is_Pow and expr.exp.is_Number and expr.exp < 0
+
+    def get_operands(self, expr):
+        """
+        Returns array operands of expr, negated terms of sums and
+        reciprocal factors of products are returned without sign and
+        with positive power.
+        """
+        array_args = [arg for arg in expr.args if not self.is_scalar(arg)]
+        if expr.is_Add:
+            return [-arg if arg.could_extract_minus_sign() else arg
+                    for arg in array_args]
+        if expr.is_Mul:
+            return [arg.base ** -arg.exp if self.is_reciprocal(arg) else arg
+                    for arg in array_args]
+        return array_args
+
+    def count_refs(self, expr):
+        if self.is_scalar(expr) or expr.is_Symbol:
+            return
+        self.refcounts[expr] = self.refcounts.get(expr, 0) + 1
+        if self.refcounts[expr] == 1:
+            for arg in self.get_operands(expr):
+                self.count_refs(arg)
+
+    def release(self, operands):
+        for arg in operands:
+            if arg in self.buffers:
+                self.refcounts[arg] -= 1
+                if self.refcounts[arg] == 0:
+                    self.free.append(self.buffers[arg])
+
+    def get_buffer(self, operands):
+        """
+        Returns buffer for result of operation on operands, prefers buffer
+        of the first operand if it is dead, buffers of other operands
+        cannot be used as they are read after the result is first written.
+        """
+        busy = {self.buffers.get(arg) for arg in operands[1:]}
+        candidates = [self.buffers.get(operands[0])] + self.free[::-1]
+        for buf in candidates:
+            if buf in self.free and buf not in busy:
+                self.free.remove(buf)
+                return buf
+        self.n_work += 1
+        return "work[{}]".format(self.n_work - 1)
+
+    def scalar_code(self, expr):
+        if expr.is_Number:
+            return repr(float(expr))
+        return self.printer.doprint(expr).replace("numpy.", "nm.")
+
+    def emit(self, expr, out=None):
+        """
+        Emits code computing expr, to out if given, returns name of
+        the value.
+        """
+        if expr in self.names:
+            code = self.names[expr]
+
+        elif self.is_scalar(expr) or expr.is_Symbol:
+            code = self.scalar_code(expr)
+            if not (expr.is_Symbol or expr.is_Number):
+                self.n_scalar += 1
+                self.lines.append("s{} = {}".format(self.n_scalar, code))
+                code = "s{}".format(self.n_scalar)
+            self.names[expr] = code
+
+        else:
+            operands = self.get_operands(expr)
+            arg_names = [self.emit(arg) for arg in operands]
+            self.release(operands)
+            buf = out if out is not None else self.get_buffer(operands)
+            self.emit_op(expr, arg_names, buf)
+            self.names[expr] = buf
+            if out is not None:
+                # outputs are never reused as work buffers
+                return out
+            self.buffers[expr] = code = buf
+
+        if out is not None:
+            self.lines.append("{}[...] = {}".format(out, code))
+            return out
+        return code
+
+    def emit_op(self, expr, arg_names, buf):
+        lines = self.lines
+        first, rest = arg_names[0], arg_names[1:]
+        acc = first
+        if expr.is_Add:
+            signs = [arg.could_extract_minus_sign()
+                     for arg in expr.args if not self.is_scalar(arg)]
+            if signs[0]:
+                lines.append("nm.negative({}, out={})".format(first, buf))
+                acc = buf
+            for name, sign in zip(rest, signs[1:]):
+                lines.append("nm.{}({}, {}, out={})".format(
+                    "subtract" if sign else "add", acc, name, buf))
+                acc = buf
+            const = sp.Add(*[arg for arg in expr.args if self.is_scalar(arg)])
+            if const != 0:
+                lines.append("nm.add({}, {}, out={})"
+                             .format(acc, self.emit(const), buf))
+                acc = buf
+
+        elif expr.is_Mul:
+            recips = [self.is_reciprocal(arg)
+                      for arg in expr.args if not self.is_scalar(arg)]
+            const = sp.Mul(*[arg for arg in expr.args if self.is_scalar(arg)])
+            if recips[0]:
+                lines.append("nm.divide({}, {}, out={})".format(
+                    self.emit(const), first, buf))
+                const = sp.S.One
+                acc = buf
+            for name, recip in zip(rest, recips[1:]):
+                lines.append("nm.{}({}, {}, out={})".format(
+                    "divide" if recip else "multiply", acc, name, buf))
+                acc = buf
+            if const == -1:
+                lines.append("nm.negative({}, out={})".format(acc, buf))
+                acc = buf
+            elif const != 1:
+                lines.append("nm.multiply({}, {}, out={})"
+                             .format(acc, self.emit(const), buf))
+                acc = buf
+
+        elif expr.is_Pow:
+            base = self.emit(expr.base)
+            if expr.exp == -1:
+                lines.append("nm.divide(1., {}, out={})".format(base, buf))
+            elif expr.exp == 2:
+                lines.append("nm.square({}, out={})".format(base, buf))
+            elif expr.exp == sp.Rational(1, 2):
+                lines.append("nm.sqrt({}, out={})".format(base, buf))
+            else:
+                lines.append("nm.power({}, {}, out={})".format(
+                    base, self.emit(expr.exp), buf))
+            acc = buf
+
+        elif expr.func in ufuncs:
+            lines.append("nm.{}({}, out={})".format(ufuncs[expr.func],
+                                                    first, buf))
+            acc = buf
+
+        else:
+            raise ValueError("unsupported expression {}".format(expr))
+
+        if acc != buf:
+            lines.append("nm.copyto({}, {})".format(buf, acc))
+
+
+def generate_function(name, exprs, array_syms, scalar_syms, doc=""):
+    """
+    Generates source of NumPy function evaluating exprs.
+
+    :param name: function name
+    :param exprs: expression or list of expressions of array_syms and
+        scalar_syms
+    :param array_syms: symbols of array arguments, all of the same shape
+    :param scalar_syms: symbols of scalar arguments
+    :param doc: docstring of the function
+    :return: source of function with arguments array_syms, scalar_syms and
+        out, out has shape of the arrays for single expression and
+        (len(exprs),) + shape for a list, it is allocated if None
+    """
+    multi = isinstance(exprs, (list, tuple))
+    exprs = list(exprs) if multi else [exprs]
+
+    # cse finds the common subexpressions, substituting them back gives
+    # the emitter whole trees in which it shares the repeated subtrees
+    replacements, reduced = sp.cse(exprs, optimizations="basic")
+    reduced = [expr.subs(list(reversed(replacements))) for expr in reduced]
+
+    emitter = UfuncEmitter(scalar_syms)
+    for expr in reduced:
+        emitter.count_refs(expr)
+    for ii, expr in enumerate(reduced):
+        emitter.emit(expr, out="out[{}]".format(ii) if multi else "out")
+
+    args = [sym.name for sym in list(array_syms) + list(scalar_syms)]
+    lines = ["@elementwise({})".format(len(reduced) if multi else ""),
+             "def {}({}, out=None):".format(name, ", ".join(args))]
+    if doc:
+        lines.append('    """{}"""'.format(doc))
+    lines += ["    shape = nm.shape({})".format(array_syms[0].name),
+              "    if out is None:",
+              "        out = nm.empty({}shape)".format(
+                  "({},) + ".format(len(reduced)) if multi else "")]
+    if emitter.n_work:
+        lines.append("    work = _get_work({!r}, {}, shape)"
+                     .format(name, emitter.n_work))
+    lines += ["    " + line for line in emitter.lines]
+    lines.append("    return out")
+    return "\n".join(lines) + "\n"
+
+
+def grad(u):
+    return [sp.diff(u, x_1), sp.diff(u, x_2)]
+
+
+def laplace(u):
+    return sp.diff(u, x_1, 2) + sp.diff(u, x_2, 2)
+
+
+def get_boundary_funs(name, u, boundaries, scalar_syms, doc):
+    """
+    Generates value and gradient of u restricted to boundaries.
+
+    :param boundaries: dict boundary name: substitution of the boundary
+    """
+    sources = []
+    for bname, subs in boundaries.items():
+        sources.append(generate_function(
+            "{}_bc_{}".format(name, bname), u.subs(subs),
+            [x_1, x_2], scalar_syms,
+            "Value of {} on {} boundary.".format(doc, bname)))
+        sources.append(generate_function(
+            "{}_bc_grad_{}".format(name, bname),
+            [g.subs(subs) for g in grad(u)],
+            [x_1, x_2], scalar_syms,
+            "Gradient of {} on {} boundary.".format(doc, bname)))
+    return sources
+
+
+def get_quarteroni2_funs():
+    velo = (1, 1)
+    u = -sp.atan((4 * (2 * x_1 - 1) ** 2 + 4 * (2 * x_2 - 1) ** 2 - 1)
+                 / (16 * sp.sqrt(eps)))
+    source = velo[0] * sp.diff(u, x_1) + velo[1] * sp.diff(u, x_2) \
+        - eps * laplace(u)
+    return [generate_function("quarteroni2_sol", u, [x_1, x_2], [eps],
+                              "Quarteroni 2 solution."),
+            generate_function("quarteroni2_sol_grad", grad(u), [x_1, x_2],
+                              [eps], "Gradient of Quarteroni 2 solution."),
+            generate_function("quarteroni2_source", source, [x_1, x_2],
+                              [eps], "Quarteroni 2 source.")] + \
+        get_boundary_funs("quarteroni2", u,
+                          {"left": {x_1: 0}, "right": {x_1: 1},
+                           "bottom": {x_2: 0}, "top": {x_2: 1}},
+                          [eps], "Quarteroni 2 solution")
+
+
+def get_quarteroni3_funs():
+    velo = (1, 1)
+    u = -x_1 * x_2 + x_1 + x_2 + (sp.exp(-(x_1 - 1) * (x_2 - 1) / eps)
+                                  - sp.exp(-1 / eps)) / (sp.exp(-1 / eps) - 1)
+    source = velo[0] * sp.diff(u, x_1) + velo[1] * sp.diff(u, x_2) \
+        - eps * laplace(u)
+    return [generate_function("quarteroni3_sol", u, [x_1, x_2], [eps],
+                              "Quarteroni 3 solution."),
+            generate_function("quarteroni3_sol_grad", grad(u), [x_1, x_2],
+                              [eps], "Gradient of Quarteroni 3 solution."),
+            generate_function("quarteroni3_source", source, [x_1, x_2],
+                              [eps], "Quarteroni 3 source.")] + \
+        get_boundary_funs("quarteroni3", u,
+                          {"left": {x_1: 0}, "right": {x_1: 1},
+                           "bottom": {x_2: 0}, "top": {x_2: 1}},
+                          [eps], "Quarteroni 3 solution")
+
+
+def get_kucera_funs():
+    # u = T(t) * s(x_1, x_2) with T = 1 - exp(-t) and flux
+    # (u**2 / 2, u**2 / 2), the source is
+    # T' * s + T**2 * s * (s_x_1 + s_x_2) - T * eps * laplace(s),
+    # the boundary and source functions are the spatial factors s
+    # and (s, s * (s_x_1 + s_x_2), -eps * laplace(s)) respectively
+    s = sp.sin(5 * x_1 * x_2) + sp.sin(-4 * x_1 * x_2 + 4 * x_1 + 4 * x_2)
+    u = (1 - sp.exp(-t)) * s
+    source_space = [s, s * (sp.diff(s, x_1) + sp.diff(s, x_2)),
+                    -eps * laplace(s)]
+    return [generate_function("kucera_sol", u, [x_1, x_2], [t],
+                              "Kucera solution."),
+            generate_function("kucera_sol_grad", grad(u), [x_1, x_2], [t],
+                              "Gradient of Kucera solution."),
+            generate_function("kucera_space_source", source_space,
+                              [x_1, x_2], [eps],
+                              "Spatial factors of Kucera source.")] + \
+        get_boundary_funs("kucera_space", s,
+                          {"left": {x_1: -1}, "right": {x_1: 1},
+                           "bottom": {x_2: -1}, "top": {x_2: 1}},
+                          [], "spatial factor of Kucera solution")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Generate manufactured solution functions")
+    parser.add_argument("--output", default="manufactured_funs.py",
+                        help="Generated module, default %(default)s",
+                        metavar="path")
+    args = parser.parse_args(argv)
+
+    sources = [header]
+    for get_funs in [get_quarteroni2_funs, get_quarteroni3_funs,
+                     get_kucera_funs]:
+        sources += get_funs()
+
+    with open(args.output, "w") as f:
+        f.write("\n\n".join(sources))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -11,9 +11,12 @@ import numpy as nm
 import pandas as pd
 import importlib
 import argparse
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import queue
 import matplotlib
 
-matplotlib.use("Qt5Agg")
 from matplotlib import pyplot as plt
 
 
@@ -21,17 +24,27 @@ from matplotlib import pyplot as plt
 from sfepy.discrete.fem import Mesh
 from sfepy.base.ioutils import ensure_path
 from sfepy.base.conf import ProblemConf
-from sfepy.discrete import Integral, Problem
-from sfepy.discrete.fem.utils import refine_mesh as refine_mesh
+from sfepy.discrete import Integral, Problem, Functions
 from sfepy.discrete.fem.meshio import GmshIO
 
 # DG imports
 from sfepy.discrete.dg.dg_1D_vizualizer import reconstruct_legendre_dofs
 
 from run_dg_utils import clear_folder, param_names
+from convergence_plots import calculate_num_order
+from dg_qp_eval import validate_qp_evaluator
+from expr_backend import set_num_threads
+from mesh_hierarchy import get_refined_mesh, is_cached_mesh, \
+    get_cached_mesh_hook
 from run_dg_utils import outputs_folder,\
     plot_conv_results, build_attrs_string, output, compute_erros, configure_output, \
-    add_dg_arguments
+    compute_erros_adaptive, norm_names, analytic_qp_cache, \
+    ErrorHistoryHook, compute_cell_errors, get_cell_errors_filename, \
+    save_cell_errors, get_cell_errors_out, \
+    add_dg_arguments, get_cell_cache_key, load_cached_cell, save_cached_cell, \
+    cell_cache_folder, ResultsStream, PhaseTimer, get_phase_columns, \
+    reset_peak_rss, get_peak_rss, get_sparse_nbytes, get_history_nbytes, \
+    save_tracemalloc_top
 
 
 def create_argument_parser():
@@ -58,11 +71,29 @@ def create_argument_parser():
     parser.add_argument("-dp", "--display-plots", help="Show interactive plots.",
                         default=False, action='store_true', dest='doplot',)
 
+    parser.add_argument("--headless", help="Use Agg backend and render all " +
+                             "figures once at the end from data collected " +
+                             "during the run",
+                        default=False, action='store_true', dest='headless',)
+
+    parser.add_argument("--render-background",
+                        help="Render figures in a background process " +
+                             "while cells are solved, implies --headless",
+                        default=False, action='store_true',
+                        dest='render_background',)
+
     parser.add_argument("-nr", "--dot-not-recalculate",
-                        help="Force racalcualting, note that loading previous" +
+                        help="Load cells already computed with the same " +
+                             "example source, parameters and mesh from " +
+                             "the cell cache instead of recalculating them, " +
+                             "note that loading previous" +
                              " results destroys detailed information about run",
                         default=False, action='store_true', dest='no_recalc', )
 
+    parser.add_argument("--cache-dir", help="Folder with cached cells",
+                        default=cell_cache_folder, metavar='path',
+                        dest='cache_dir', )
+
     parser.add_argument("-v", "--verbose", help="To be verbose or",
                         default=False, action='store_true', dest='verbose',)
 
@@ -79,6 +110,77 @@ def create_argument_parser():
     parser.add_argument('--refines', metavar="[1, 2, 3 ...]", default=None,
                         help='List of refinement degrees', type=str)
 
+    parser.add_argument("-j", "--jobs", metavar="int", type=int, default=1,
+                        help="Number of worker processes running the " +
+                             "(refine, order) cells, 1 runs them in order " +
+                             "in the main process",
+                        dest="jobs")
+
+    parser.add_argument("--adaptive", help="Refine each order only until " +
+                             "its convergence rate stabilizes, its error " +
+                             "reaches noise level or the next refine would " +
+                             "exceed time or DOF budget, refines are then " +
+                             "candidate levels, default 1 to 8",
+                        default=False, action='store_true', dest='adaptive')
+
+    parser.add_argument("--rate-tol", metavar="float", type=float,
+                        default=0.05, dest="rate_tol",
+                        help="Maximal spread of last rates considered stable")
+
+    parser.add_argument("--rate-window", metavar="int", type=int,
+                        default=2, dest="rate_window",
+                        help="Number of last rates compared for stability")
+
+    parser.add_argument("--err-floor", metavar="float", type=float,
+                        default=1e-12, dest="err_floor",
+                        help="Relative error considered noise level")
+
+    parser.add_argument("--time-budget", metavar="float", type=float,
+                        default=None, dest="time_budget",
+                        help="Wall time budget in seconds for each order")
+
+    parser.add_argument("--max-dofs", metavar="int", type=int,
+                        default=None, dest="max_dofs",
+                        help="Maximal number of DOFs for each order")
+
+    parser.add_argument("--err-quad-order", metavar="int", type=int,
+                        default=None, dest="err_quad_order",
+                        help="Fixed order of quadrature for errors, by " +
+                             "default the order is raised from " +
+                             "2 * (order + 1) until the L2 error settles")
+
+    parser.add_argument("--err-quad-tol", metavar="float", type=float,
+                        default=1e-3, dest="err_quad_tol",
+                        help="Relative change of the L2 error at which " +
+                             "the error quadrature order stops rising")
+
+    parser.add_argument("--threads", metavar="int", type=int, default=1,
+                        help="Number of threads evaluating generated " +
+                             "example functions in chunks, per job")
+
+    parser.add_argument("--error-history", metavar="k", type=int, default=0,
+                        dest="error_history",
+                        help="Track L2 error and conserved quantities " +
+                             "every k time steps in error_history file " +
+                             "of each run, 0 to disable")
+
+    parser.add_argument("--check-qp-eval", action="store_true",
+                        dest="check_qp_eval", default=False,
+                        help="Check values and gradients in qps used for " +
+                             "errors against the volume integral terms")
+
+    parser.add_argument("--qp-cache-size", metavar="MB", type=float,
+                        default=1024, dest="qp_cache_size",
+                        help="Memory bound of the cache of analytic " +
+                             "solution values in quadrature points shared " +
+                             "by orders on one mesh")
+
+    parser.add_argument("--tracemalloc", metavar="int", type=int, default=0,
+                        help="Save this many top allocation sites traced " +
+                             "by tracemalloc to tracemalloc.txt of each " +
+                             "cell, 0 disables tracing",
+                        dest="tracemalloc")
+
     add_dg_arguments(parser)
 
     return parser
@@ -117,7 +219,26 @@ def get_run_info():
         # refining options
         "--orders"  : " --orders={--orders}",
         "--refines" : " --refines={--refines}",
+        "--jobs"    : " --jobs={--jobs}",
+        "--tracemalloc" : " --tracemalloc={--tracemalloc}",
+        "--err-quad-order" : " --err-quad-order={--err-quad-order}",
+        "--err-quad-tol" : " --err-quad-tol={--err-quad-tol}",
+        "--qp-cache-size" : " --qp-cache-size={--qp-cache-size}",
+        "--check-qp-eval" : " --check-qp-eval",
+        "--error-history" : " --error-history={--error-history}",
+        "--threads" : " --threads={--threads}",
+        "--adaptive" : " --adaptive",
+        "--rate-tol" : " --rate-tol={--rate-tol}",
+        "--rate-window" : " --rate-window={--rate-window}",
+        "--err-floor" : " --err-floor={--err-floor}",
+        "--time-budget" : " --time-budget={--time-budget}",
+        "--max-dofs" : " --max-dofs={--max-dofs}",
+        "--dot-not-recalculate" : " --dot-not-recalculate",
+        "--cache-dir" : " --cache-dir={--cache-dir}",
         
+        "--headless" : " --headless",
+        "--render-background" : " --render-background",
+
         "--verbose" : " --verbose"
     }
 
@@ -127,113 +248,375 @@ def get_run_info():
     return run_cmd, opt_args, output_dir_key, is_finished_basename
 
 
-def main(argv):
-    if argv is None:
-        argv = sys.argv[1:]
+# timed in run_conv_cell
+cell_phases = ["setup", "assembly", "linsolve", "limiter", "solve", "save",
+               "errors"]
+# timed in main
+study_phases = ["mesh", "plot"]
 
-    parser = create_argument_parser()
-    args = parser.parse_args(argv)
+# phases counted to the cost of cell in adaptive mode
+cost_phases = ["setup", "solve", "save", "errors"]
 
+result_columns = ["h", "n_cells", "mean_vol", "order", "n_dof",
+                  "ana_l2", "diff_l2", "err_rel",
+                  "elapsed", "cour", "actual_dt",
+                  "nls_error", "nls_iter",
+                  "peak_rss", "mtx_nbytes", "history_nbytes",
+                  "err_quad_order"] + norm_names + \
+                 get_phase_columns(cell_phases + study_phases)
+
+
+def get_problem_module_name(problem_file):
     prefix = ""
 
-    problem_module_name = args.problem_file.replace(".py", "").strip("\\.") \
+    problem_module_name = problem_file.replace(".py", "").strip("\\.") \
         .replace("\\", ".").replace("/", ".")
     if not problem_module_name.startswith(prefix):
         problem_module_name = prefix + problem_module_name
+    return problem_module_name
 
-    problem_module = importlib.import_module(problem_module_name)
 
-    mesh = None
-    if args.mesh_file is not None:
-        mesh = str(Path(args.mesh_file))
+def get_define_kwargs(args, gen_mesh, order):
+    if is_cached_mesh(gen_mesh):
+        gen_mesh = get_cached_mesh_hook(gen_mesh)
+    return dict(
+        filename_mesh=gen_mesh,
+        approx_order=order,
 
-    refines = parse_str2tuple_default(args.refines, (1, 2, 3, 4, 5))
-    orders = parse_str2tuple_default(args.orders, (0, 1, 2, 3, 4))
+        adflux=args.adflux,
+        limit=args.limit,
 
-    if problem_module.dim == 1:
-        sol_fig, axs = plt.subplots(len(orders), len(refines), figsize=(18, 10))
+        cw=args.cw,
+        diffcoef=args.diffcoef,
+        diffscheme=args.diffscheme,
 
-    mod = sys.modules[problem_module_name]
-    results = []
-    for ir, refine in enumerate(refines):
-        if mesh is not None:
-            gen_mesh = refine_mesh(mesh, refine)
-        else:
-            gen_mesh = refine
-        for io, order in enumerate(orders):
-            conf = ProblemConf.from_dict(
-                problem_module.define(
-                    filename_mesh=gen_mesh,
-                    approx_order=order,
-
-                    adflux=args.adflux,
-                    limit=args.limit,
-
-                    cw=args.cw,
-                    diffcoef=args.diffcoef,
-                    diffscheme=args.diffscheme,
-
-                    cfl=args.cfl,
-                    dt=args.dt,
-                ), mod, verbose=args.verbose)
-            conf.options.absolute_mesh_path = True
-
-            if args.output_dir is None:
-                base_output_folder = Path(outputs_folder) / "conv_tests_out" /\
-                                           conf.example_name
-            elif "{}" in args.output_dir:
-                base_output_folder = Path(args.output_dir.format(conf.example_name))
-            else:
-                base_output_folder = Path(args.output_dir)
+        cfl=args.cfl,
+        dt=args.dt,
+    )
+
+
+def create_conf(problem_module, args, gen_mesh, order):
+    """
+    Creates parametrized conf for one cell of the convergence study
 
-            output_folder = base_output_folder / ("h" + str(refine))
-            output_folder = output_folder / ("o" + str(order))
+    :param problem_module: module with define method
+    :param args: parsed arguments
+    :param gen_mesh: mesh file or refine passed to define as filename_mesh
+    :param order: approximation order
+    :return: ProblemConf
+    """
+    mod = sys.modules[problem_module.__name__]
+    conf = ProblemConf.from_dict(
+        problem_module.define(**get_define_kwargs(args, gen_mesh, order)),
+        mod, verbose=args.verbose)
+    conf.options.absolute_mesh_path = True
+    return conf
+
+
+def get_base_output_folder(args, conf):
+    if args.output_dir is None:
+        base_output_folder = Path(outputs_folder) / "conv_tests_out" /\
+                                   conf.example_name
+    elif "{}" in args.output_dir:
+        base_output_folder = Path(args.output_dir.format(conf.example_name))
+    else:
+        base_output_folder = Path(args.output_dir)
+    return base_output_folder
 
-            configure_output({'output_screen': not args.no_output_screen,
-                              'output_log_name': str(output_folder / "last_run.txt")})
 
-            output("----------------Running--------------------------")
-            output("{}: {}".format(conf.example_name, time.asctime()))
-            output('refine:', refine, 'order:', order)
+def run_conv_cell(problem_module_name, args, gen_mesh, refine, order):
+    """
+    Runs one (refine, order) cell of the convergence study, all arguments
+    are picklable so that the cell can be sent to a worker process.
+
+    :param problem_module_name: importable name of the problem module
+    :param args: parsed arguments
+    :param gen_mesh: refined mesh file or refine passed to define
+    :param refine: refinement level
+    :param order: approximation order
+    :return: result tuple, cell geometry name, data for 1D plots or None
+    """
+    problem_module = importlib.import_module(problem_module_name)
+    conf = create_conf(problem_module, args, gen_mesh, order)
+
+    base_output_folder = get_base_output_folder(args, conf)
+    output_folder = base_output_folder / ("h" + str(refine))
+    output_folder = output_folder / ("o" + str(order))
+
+    configure_output({'output_screen': not args.no_output_screen,
+                      'output_log_name': str(output_folder / "last_run.txt")})
+
+    cache_key = get_cell_cache_key(problem_module,
+                                   get_define_kwargs(args, gen_mesh, order),
+                                   refine, order, gen_mesh,
+                                   extra=(result_columns,
+                                          args.err_quad_order,
+                                          args.err_quad_tol,
+                                          args.error_history))
+    if args.no_recalc:
+        cell_outs = load_cached_cell(args.cache_dir, cache_key,
+                                     str(output_folder))
+        if cell_outs is not None:
+            output('refine:', refine, 'order:', order,
+                   'loaded from cache', cache_key)
+            return cell_outs
+
+    output("----------------Running--------------------------")
+    output("{}: {}".format(conf.example_name, time.asctime()))
+    output('refine:', refine, 'order:', order)
+
+    set_num_threads(args.threads)
+    reset_peak_rss()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    timer = PhaseTimer()
+    mem_stats = {}
+    with timer.phase("setup"):
+        factory = get_problem_factory((problem_module_name, gen_mesh), conf)
+        h, n_cells, pb, vols = create_problem(conf, factory)
+
+    output_format = pjoin(str(output_folder), "sol-h{:02d}o{:02d}.*.{}"
+                          .format(n_cells, order,
+                                  "vtk" if problem_module.dim == 1 else "msh"))
+    output("Output set to {}, clearing.".format(output_format))
+
+    clear_folder(output_format, confirm=False, doit=True)
+    ensure_path(output_format)
+
+    step_hook = None
+    if args.error_history:
+        step_hook = ErrorHistoryHook(conf.sol_fun,
+                                     str(output_folder / "error_history"),
+                                     args.error_history,
+                                     args.err_quad_order or 20)
+    pb, elapsed = run_calc(pb, output_format, timer, mem_stats, step_hook,
+                           save=False)
+    if step_hook is not None:
+        step_hook.close()
+
+    output("{}: {}".format(conf.example_name, time.asctime()))
+    output("------------------Finished------------------\n\n")
+
+    # analytic solution differs between cells only by mesh and time
+    fun_key = (problem_module_name,
+               repr(sorted((k, v) for k, v in
+                           get_define_kwargs(args, gen_mesh, order).items()
+                           if k not in ("filename_mesh", "approx_order"))))
+    analytic_qp_cache.max_nbytes = args.qp_cache_size * 2 ** 20
+    norm_args = dict(grad_norms=True,
+                     diffcoef=getattr(conf, "diffcoef", None),
+                     cw=getattr(conf, "cw", None),
+                     fun_key=fun_key,
+                     analytic_grad_fun=getattr(conf, "sol_grad_fun", None))
+    if args.check_qp_eval:
+        validate_qp_evaluator(pb, args.err_quad_order or 20)
+
+    with timer.phase("errors"):
+        if args.err_quad_order is None:
+            (ana_l2, ana_qp, diff_l2, rel_l2, num_qp, norms, qp_data,
+             quad_order) = compute_erros_adaptive(conf.sol_fun, pb,
+                                                  args.err_quad_tol,
+                                                  **norm_args)
+        else:
+            quad_order = args.err_quad_order
+            ana_l2, ana_qp, diff_l2, rel_l2, num_qp, norms, qp_data = \
+                compute_erros(conf.sol_fun, pb, quad_order, **norm_args)
+
+    sol_file = output_format.replace("*", "0")
+    cell_errors = compute_cell_errors(qp_data, ana_qp, num_qp)
+    cell_errors_file = get_cell_errors_filename(sol_file)
+    save_cell_errors(cell_errors_file, cell_errors, quad_order=quad_order)
+
+    def add_cell_errors(out, problem, state, extend=False):
+        out.update(get_cell_errors_out(cell_errors))
+        return out
+
+    save_solution(pb, output_format, timer, add_cell_errors)
+
+    n_dof = pb.fields["f"].n_nod
+
+    result = (h, n_cells, nm.mean(vols), order, n_dof,
+              ana_l2, diff_l2, rel_l2, elapsed,
+              getattr(pb.ts_conf, "cour", nm.NAN),
+              getattr(pb.ts_conf, "dt", nm.NAN),
+              getattr(pb.solver.status.nls_status, "err", nm.NAN),
+              getattr(pb.solver.status.nls_status, "n_iter", nm.NAN),
+              get_peak_rss(),
+              mem_stats.get("mtx_nbytes", nm.NAN),
+              get_history_nbytes(pb),
+              quad_order
+              ) + tuple(norms[name] for name in norm_names) + timer.get_row(cell_phases)
+
+    if args.tracemalloc:
+        save_tracemalloc_top(tracemalloc.take_snapshot(),
+                             str(output_folder / "tracemalloc.txt"),
+                             args.tracemalloc)
+        tracemalloc.stop()
+
+    plot_data = None
+    if problem_module.dim == 1:
+        plot_data = get_1D_plot_data(pb, ana_qp, num_qp, quad_order)
 
-            h, n_cells, pb, vols = create_problem(conf)
+    cell_outs = result, pb.domain.mesh.descs[0], plot_data
+    cell_files = [sol_file, cell_errors_file]
+    if step_hook is not None:
+        cell_files.append(step_hook.stream.filename)
+    save_cached_cell(args.cache_dir, cache_key, cell_files, cell_outs)
+    return cell_outs
 
-            output_format = pjoin(str(output_folder), "sol-h{:02d}o{:02d}.*.{}"
-                                  .format(n_cells, order,
-                                          "vtk" if problem_module.dim == 1 else "msh"))
-            output("Output set to {}, clearing.".format(output_format))
 
-            clear_folder(output_format, confirm=False, doit=True)
-            ensure_path(output_format)
+def main(argv):
+    if argv is None:
+        argv = sys.argv[1:]
 
-            pb, elapsed = run_calc(pb, output_format)
+    parser = create_argument_parser()
+    args = parser.parse_args(argv)
 
-            output("{}: {}".format(conf.example_name, time.asctime()))
-            output("------------------Finished------------------\n\n")
+    problem_module_name = get_problem_module_name(args.problem_file)
+    problem_module = importlib.import_module(problem_module_name)
 
-            ana_l2, ana_qp, diff_l2, rel_l2, num_qp = compute_erros(conf.sol_fun, pb)
+    mesh = None
+    if args.mesh_file is not None:
+        mesh = str(Path(args.mesh_file))
+
+    if args.adaptive:
+        refines = parse_str2tuple_default(args.refines, tuple(range(1, 9)))
+    else:
+        refines = parse_str2tuple_default(args.refines, (1, 2, 3, 4, 5))
+    orders = parse_str2tuple_default(args.orders, (0, 1, 2, 3, 4))
 
-            n_dof = pb.fields["f"].n_nod
+    deferred = args.headless or args.render_background
+    if deferred:
+        plt.switch_backend("Agg")
+    elif args.doplot:
+        plt.switch_backend("Qt5Agg")
 
-            result = (h, n_cells, nm.mean(vols), order, n_dof,
-                      ana_l2, diff_l2, rel_l2, elapsed,
-                      getattr(pb.ts_conf, "cour", nm.NAN),
-                      getattr(pb.ts_conf, "dt", nm.NAN),
-                      getattr(pb.solver.status.nls_status, "err", nm.NAN),
-                      getattr(pb.solver.status.nls_status, "n_iter", nm.NAN)
-                      )
+    if problem_module.dim == 1 and not deferred:
+        sol_fig, axs = plt.subplots(len(orders), len(refines), figsize=(18, 10))
 
-            results.append(result)
+    gen_meshes = {}
+    mesh_timers = {}
+
+    def get_gen_mesh(refine):
+        if refine not in gen_meshes:
+            mesh_timers[refine] = PhaseTimer()
+            with mesh_timers[refine].phase("mesh"):
+                if mesh is not None:
+                    gen_meshes[refine] = get_refined_mesh(mesh, refine)
+                else:
+                    gen_meshes[refine] = refine
+        return gen_meshes[refine]
+
+    conf = create_conf(problem_module, args, get_gen_mesh(refines[0]),
+                       orders[-1])
+    base_output_folder = get_base_output_folder(args, conf)
+    ensure_path(str(base_output_folder) + os.sep)
+
+    renderer_args = (problem_module_name, args, get_gen_mesh(refines[0]),
+                     orders, refines, base_output_folder)
+    render_queue = times_queue = renderer_process = None
+    if args.render_background:
+        # cells are drawn in the background while next cells are solved
+        render_queue = multiprocessing.Queue()
+        times_queue = multiprocessing.Queue()
+        # daemon does not keep the interpreter alive if the study fails
+        renderer_process = multiprocessing.Process(
+            target=render_figures_worker,
+            args=(render_queue, times_queue) + renderer_args, daemon=True)
+        renderer_process.start()
+
+    # both map variants yield cell outputs lazily in the order of cells
+    executor = None
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        cell_map = executor.map
+    else:
+        cell_map = map
 
-            if problem_module.dim == 1:
-                plot_1D_snr(conf, pb, ana_qp, num_qp,
-                            io, order, orders, ir,
-                            sol_fig, axs)
-                sol_fig.savefig(base_output_folder /
-                                ("err-sol-i20" + build_attrs_string(conf) + ".png"),
-                                dpi=100)
+    def run_cells(cells):
+        cell_args = zip(*[(problem_module_name, args, get_gen_mesh(refine),
+                           refine, order)
+                          for ir, refine, io, order in cells])
+        return zip(cells, cell_map(run_conv_cell, *cell_args))
 
-    err_df = create_error_df(conf, pb, results)
+    if args.adaptive:
+        cell_outs = run_cells_adaptive(run_cells, args, refines, orders,
+                                       problem_module.dim)
+    else:
+        cell_outs = run_cells([(ir, refine, io, order)
+                               for ir, refine in enumerate(refines)
+                               for io, order in enumerate(orders)])
+
+    results_stream = ResultsStream(str(base_output_folder / "results_stream"),
+                                   result_columns)
+    output("Streaming results to {}".format(results_stream.filename))
+    gel = None
+    plot_cells = []
+    quad_orders = []
+    sol_fig_file = None
+    # mesh is shared by all orders, its time goes to the first row only
+    mesh_reported = set()
+    try:
+        for (ir, refine, io, order), (result, gel, plot_data) in cell_outs:
+            plot_timer = PhaseTimer()
+            if problem_module.dim == 1 and deferred:
+                plot_cells.append((ir, io, order, plot_data))
+                if render_queue is not None:
+                    render_queue.put((ir, io, order, plot_data))
+            elif problem_module.dim == 1:
+                with plot_timer.phase("plot"):
+                    plot_1D_snr(conf, plot_data,
+                                io, order, orders, ir,
+                                sol_fig, axs)
+                    quad_orders.append(plot_data["quad_order"])
+                    # name changes when cells use other error quadrature
+                    old_file = sol_fig_file
+                    sol_fig_file = base_output_folder / \
+                        get_sol_fig_filename(conf, quad_orders)
+                    sol_fig.savefig(sol_fig_file, dpi=100)
+                    if old_file is not None and old_file != sol_fig_file:
+                        os.remove(old_file)
+
+            mesh_timer = mesh_timers[refine]
+            if refine in mesh_reported:
+                mesh_timer = PhaseTimer()
+            mesh_reported.add(refine)
+            results_stream.append(result + mesh_timer.get_row(["mesh"])
+                                  + plot_timer.get_row(["plot"]))
+    except BaseException:
+        if renderer_process is not None:
+            render_queue.put(None)
+            renderer_process.join()
+        raise
+
+    if executor is not None:
+        executor.shutdown()
+
+    configure_output({'output_screen': not args.no_output_screen,
+                      'output_log_name': str(base_output_folder /
+                                             "last_run.txt")})
+
+    results_stream.close()
+    rows = results_stream.read()
+    err_df = create_error_df(conf, gel, rows.copy())
+
+    if deferred:
+        if renderer_process is not None:
+            render_queue.put(err_df)
+            cell_times, final_times = get_render_times(renderer_process,
+                                                       times_queue)
+        else:
+            renderer = FigureRenderer(*renderer_args)
+            cell_times = [renderer.add_cell(*cell) for cell in plot_cells]
+            final_times = renderer.finish(err_df)
+        # rows are in the order of plot cells, saving the figures is
+        # counted to the last row
+        plot_columns = ["plot_wall", "plot_cpu"]
+        for index, times in zip(rows.index, cell_times):
+            rows.loc[index, plot_columns] += list(times)
+        rows.loc[rows.index[-1], plot_columns] += list(final_times)
+        err_df = create_error_df(conf, gel, rows)
 
     err_df.to_csv(base_output_folder / "results.csv")
 
@@ -242,39 +625,281 @@ def main(argv):
 
     output(err_df)
 
-    conv_fig = plot_conv_results(base_output_folder, conf, err_df, save=True)
-    conv_fig.savefig(base_output_folder / "results.png", dpi=200)
+    if not deferred:
+        conv_fig = plot_conv_results(base_output_folder, conf, err_df,
+                                     save=True)
+        conv_fig.savefig(base_output_folder / "results.png", dpi=200)
+
+        if args.doplot:
+            plt.show()
 
-    if args.doplot:
-        plt.show()
 
+class FigureRenderer(object):
+    """
+    Renders figures of the study using Agg backend, 1D cells are drawn as
+    they are added and every figure is saved once in finish. Constructor
+    arguments are picklable so that rendering can run in a background
+    process.
+    """
 
-def create_error_df(conf, pb, results):
-    results = nm.array(results)
-    err_df = pd.DataFrame(results,
-                          columns=["h", "n_cells", "mean_vol", "order", "n_dof",
-                                   "ana_l2", "diff_l2", "err_rel",
-                                   "elapsed", "cour", "actual_dt",
-                                   "nls_error", "nls_iter"])
-    err_df = calculate_num_order(err_df)
+    def __init__(self, problem_module_name, args, gen_mesh, orders, refines,
+                 base_output_folder):
+        """
+        :param problem_module_name: importable name of the problem module
+        :param args: parsed arguments
+        :param gen_mesh: mesh passed to define of conf used in titles
+        :param orders:
+        :param refines:
+        :param base_output_folder:
+        """
+        plt.switch_backend("Agg")
+        problem_module = importlib.import_module(problem_module_name)
+        self.conf = create_conf(problem_module, args, gen_mesh, orders[-1])
+        self.dim = problem_module.dim
+        self.orders = orders
+        self.base_output_folder = base_output_folder
+        self.quad_orders = []
+        if self.dim == 1:
+            self.sol_fig, self.axs = plt.subplots(len(orders), len(refines),
+                                                  figsize=(18, 10))
+
+    def add_cell(self, ir, io, order, plot_data):
+        """
+        Draws 1D cell to the solution figure.
+
+        :return: wall and CPU time of drawing
+        """
+        timer = PhaseTimer()
+        with timer.phase("plot"):
+            plot_1D_snr(self.conf, plot_data,
+                        io, order, self.orders, ir,
+                        self.sol_fig, self.axs)
+        self.quad_orders.append(plot_data["quad_order"])
+        return timer.get_row(["plot"])
+
+    def finish(self, err_df):
+        """
+        Saves the solution figure and renders the convergence figure.
+
+        :return: wall and CPU time of rendering
+        """
+        timer = PhaseTimer()
+        with timer.phase("plot"):
+            if self.dim == 1:
+                if self.quad_orders:
+                    self.sol_fig.savefig(
+                        self.base_output_folder /
+                        get_sol_fig_filename(self.conf, self.quad_orders),
+                        dpi=100)
+                plt.close(self.sol_fig)
+
+            conv_fig = plot_conv_results(self.base_output_folder, self.conf,
+                                         err_df, save=True)
+            conv_fig.savefig(self.base_output_folder / "results.png",
+                             dpi=200)
+            plt.close(conv_fig)
+        output("Figures rendered in {:.2f} s"
+               .format(timer.get_row(["plot"])[0]))
+        return timer.get_row(["plot"])
+
+
+def render_figures_worker(render_queue, times_queue, *renderer_args):
+    """
+    Background process drawing 1D cells from render_queue until it gets
+    the results dataframe, then it finishes the figures and puts times of
+    cells and of the finish to times_queue. None in render_queue stops it
+    without saving figures.
+    """
+    renderer = FigureRenderer(*renderer_args)
+    cell_times = []
+    while True:
+        item = render_queue.get()
+        if item is None:
+            return
+        if isinstance(item, pd.DataFrame):
+            break
+        cell_times.append(renderer.add_cell(*item))
+    times_queue.put((cell_times, renderer.finish(item)))
+
+
+def get_render_times(renderer_process, times_queue):
+    """
+    Waits for render_figures_worker.
+
+    :return: times of cells and of the finish, NaN if rendering failed
+    """
+    while True:
+        try:
+            times = times_queue.get(timeout=1.)
+            break
+        except queue.Empty:
+            if not renderer_process.is_alive():
+                output("Rendering of figures failed!")
+                times = [], (nm.nan, nm.nan)
+                break
+    renderer_process.join()
+    return times
+
+
+def get_stop_reason(history, args, dim):
+    """
+    Decides whether to stop refining for one order in the adaptive mode.
+
+    :param history: list of result dicts of the order so far
+    :param args: parsed arguments with err_floor, rate_tol, rate_window,
+        time_budget and max_dofs
+    :param dim: dimension of the problem, used for estimating growth
+        of the cost when only one refine was run
+    :return: reason to stop or None to continue refining
+    """
+    last = history[-1]
+    if last["err_rel"] < args.err_floor:
+        return "relative error {:.2e} reached noise level".format(
+            last["err_rel"])
+
+    if len(history) > args.rate_window:
+        rates = [nm.log(row["diff_l2"] / prev["diff_l2"])
+                 / nm.log(row["h"] / prev["h"])
+                 for prev, row in zip(history[:-1], history[1:])]
+        rates = rates[-args.rate_window:]
+        if nm.ptp(rates) < args.rate_tol:
+            return "rate stabilized at {:.2f}".format(rates[-1])
+
+    costs = [sum(row[name + "_wall"] for name in cost_phases)
+             for row in history]
+    cost_growth = dof_growth = 2 ** dim
+    if len(history) > 1:
+        if costs[-2] > 0:
+            cost_growth = costs[-1] / costs[-2]
+        dof_growth = last["n_dof"] / history[-2]["n_dof"]
+
+    next_cost = costs[-1] * cost_growth
+    if args.time_budget is not None and \
+            sum(costs) + next_cost > args.time_budget:
+        return "next refine estimated to take {:.1f} s, {:.1f} s " \
+               "of budget left".format(next_cost,
+                                       args.time_budget - sum(costs))
+
+    next_dofs = last["n_dof"] * dof_growth
+    if args.max_dofs is not None and next_dofs > args.max_dofs:
+        return "next refine estimated to have {:.0f} DOFs".format(next_dofs)
+
+    return None
+
+
+def run_cells_adaptive(run_cells, args, refines, orders, dim):
+    """
+    Runs refines one by one for all orders still being refined. Order stops
+    refining when get_stop_reason returns reason.
+
+    :param run_cells: function taking list of cells (ir, refine, io, order)
+        and returning iterable of (cell, cell outputs) pairs
+    :param args: parsed arguments
+    :param refines: refines to try in order
+    :param orders: orders
+    :param dim: dimension of the problem
+    :return: iterable of (cell, cell outputs) pairs
+    """
+    histories = {order: [] for order in orders}
+    active = list(enumerate(orders))
+    for ir, refine in enumerate(refines):
+        if not active:
+            break
+        cells = [(ir, refine, io, order) for io, order in active]
+        for cell, cell_outs in run_cells(cells):
+            histories[cell[3]].append(dict(zip(result_columns, cell_outs[0])))
+            yield cell, cell_outs
+
+        still_active = []
+        for io, order in active:
+            reason = get_stop_reason(histories[order], args, dim)
+            if reason is None:
+                still_active.append((io, order))
+            else:
+                output("order: {} stopped at refine: {}, {}"
+                       .format(order, refine, reason))
+        active = still_active
+
+
+def create_error_df(conf, gel, results):
+    """
+    :param conf:
+    :param gel: geometry of mesh cells
+    :param results: dataframe or list of result tuples with result_columns
+    :return:
+    """
+    err_df = pd.DataFrame(results, columns=result_columns, dtype=float)
+    err_df = calculate_num_order(err_df, dim=1)
     for name in param_names:
         err_df[name] = conf.__dict__[name]
-    err_df["gel"] = pb.domain.mesh.descs[0]
+    err_df["gel"] = gel
     return err_df
 
 
-def create_problem(conf):
+class ProblemFactory(object):
+    """
+    Creates problems for confs differing only in approximation order, the
+    domain with its cmesh connectivity and regions is built only once from
+    the first conf and shared by all created problems.
+    """
+
+    def __init__(self, conf):
+        pb = Problem.from_conf(conf, init_fields=False, init_equations=False,
+                               init_solvers=False)
+        self.domain = pb.domain
+        self.vols = self.domain.cmesh.get_volumes(1)
+
+    def create_problem(self, conf):
+        """
+        Follows Problem.from_conf, but skips mesh loading and region setup.
+        Materials, initial and boundary conditions are taken from conf by
+        set_equations and time_update as for Problem.from_conf.
+        """
+        functions = Functions.from_conf(conf.functions)
+        active_only = conf.options.get('active_only', True)
+        pb = Problem('problem_from_conf', conf=conf, functions=functions,
+                     domain=self.domain, auto_conf=False,
+                     active_only=active_only)
+        pb.clear_equations()
+        pb.set_fields(conf.fields)
+        pb.set_equations(conf.equations)
+        pb.set_conf_solvers(conf.solvers, conf.options)
+        return pb
+
+
+# factories kept alive in this process, keyed by problem module and mesh,
+# with --jobs a factory is reused only when the worker gets next order of
+# the same mesh
+problem_factories = {}
+
+
+def get_problem_factory(key, conf):
+    """
+    Returns factory for key, only the last used factory is kept so that
+    domains of coarser refines are released.
+    """
+    if key not in problem_factories:
+        problem_factories.clear()
+        problem_factories[key] = ProblemFactory(conf)
+    return problem_factories[key]
+
+
+def create_problem(conf, factory=None):
     try:
         conf.options.save_times = 0
     except AttributeError:
         pass
-    pb = Problem.from_conf(conf)
+    if factory is None:
+        pb = Problem.from_conf(conf)
+        vols = pb.domain.cmesh.get_volumes(1)
+    else:
+        pb = factory.create_problem(conf)
+        vols = factory.vols
     try:
         conf.options.pre_process_hook(pb)
     except AttributeError:
         pass
     n_cells = pb.domain.shape.n_el
-    vols = pb.domain.cmesh.get_volumes(1)
     h = nm.mean(vols)
     if "2_3" in pb.domain.geom_els:
         h = nm.mean(nm.sqrt(4 * vols))
@@ -283,84 +908,128 @@ def create_problem(conf):
     return h, n_cells, pb, vols
 
 
-def run_calc(pb, output_format):
+def record_matrix_nbytes(fun_grad, mem_stats):
+    """
+    Wraps matrix evaluation to record size of the largest assembled matrix
+    in mem_stats["mtx_nbytes"].
+    """
+    def recorded_fun_grad(*args, **kwargs):
+        mtx = fun_grad(*args, **kwargs)
+        mem_stats["mtx_nbytes"] = max(mem_stats.get("mtx_nbytes", 0),
+                                      get_sparse_nbytes(mtx))
+        return mtx
+
+    return recorded_fun_grad
+
+
+def instrument_solvers(pb, timer, mem_stats=None):
+    """
+    Wraps residual and matrix evaluation, linear solver and limiter
+    of the problem solvers to record their times in timer phases
+    assembly, linsolve and limiter and matrix size in mem_stats.
+    """
+    tss = getattr(pb, "solver", None)
+    if tss is None:
+        return
+    nls = getattr(tss, "nls", tss)
+    nls.fun = timer.wrap("assembly", nls.fun)
+    fun_grad = nls.fun_grad
+    if mem_stats is not None:
+        fun_grad = record_matrix_nbytes(fun_grad, mem_stats)
+    nls.fun_grad = timer.wrap("assembly", fun_grad)
+    nls.lin_solver = timer.wrap("linsolve", nls.lin_solver)
+    if hasattr(tss, "post_stage_hook"):
+        tss.post_stage_hook = timer.wrap("limiter", tss.post_stage_hook)
+
+
+def run_calc(pb, output_format, timer=None, mem_stats=None, step_hook=None,
+             save=True):
+    if timer is None:
+        timer = PhaseTimer()
+    instrument_solvers(pb, timer, mem_stats)
     tt = time.process_time()
-    pb.sol = pb.solve()
+    with timer.phase("solve"):
+        pb.sol = pb.solve(step_hook=step_hook)
     elapsed = time.process_time() - tt
-    pb.save_state(output_format.replace("*", "0"), state=pb.sol,
-                  file_format="gmsh-dg")
+    if save:
+        save_solution(pb, output_format, timer)
     return pb, elapsed
 
 
-def calculate_num_order(err_df):
-    """
-    Uses diff_l2 and n_rows columns of the dataframe to calculate num_order,
-    splits dataframe on order clumn
-    :param err_df: dataframe, columns: ["n_rows", "order", diff_l2]
-    :return:
-    """
-    res_df = pd.DataFrame()
-    for order in err_df["order"].unique():
-        order_err_df = err_df[err_df["order"] == order].sort_values("n_cells")
+def save_solution(pb, output_format, timer, post_process_hook=None):
+    with timer.phase("save"):
+        pb.save_state(output_format.replace("*", "0"), state=pb.sol,
+                      file_format="gmsh-dg",
+                      post_process_hook=post_process_hook)
 
-        num_orders = [nm.NAN]
 
-        last_err = order_err_df.iloc[0]["diff_l2"]
-        last_h = order_err_df.iloc[0]["h"]
-        #         print(order_err_df.iloc[1:, :])
-        for i, row in order_err_df.iloc[1:, :].iterrows():
-            num_order = nm.log(row["diff_l2"] / last_err) \
-                        / nm.log(row["h"] / last_h)
-            #             print(row["err_l2"] / last_err)
-            #             print(row["n_rows] / last_h)
-            #             print("-------------------")
+def get_sol_fig_filename(conf, quad_orders):
+    """
+    :param quad_orders: orders of the error quadrature of plotted cells
+    :return: file name of the figure with 1D solutions and errors
+    """
+    lo, hi = min(quad_orders), max(quad_orders)
+    integral = str(lo) if lo == hi else "{}-{}".format(lo, hi)
+    return "err-sol-i" + integral + build_attrs_string(conf) + ".png"
 
-            last_err = row["diff_l2"]
-            last_h = row["h"]
-            num_orders.append(num_order)
 
-        order_err_df["num_order"] = num_orders
-        res_df = res_df.append(order_err_df)
-    return res_df
+def get_1D_plot_data(pb, ana_qp, num_qp, quad_order=20):
+    """
+    Extracts data needed by plot_1D_snr from solved 1D problem, so that
+    plotting does not need the problem itself.
+
+    :param pb: problem with numerical solution
+    :param ana_qp: values of analytic solution in qps
+    :param num_qp: values of numerical solution in qps
+    :param quad_order: order of the quadrature ana_qp and num_qp are in
+    :return: dict with n_cells, quad_order, fqps, ana_qp, num_qp, xx and uu
+    """
+    idiff = Integral('idiff', quad_order)
+    qps = pb.fields["f"].mapping.get_physical_qps(idiff.get_qp("1_2")[0])
+    coors = pb.domain.mesh.coors
+    u = pb.fields["f"].unravel_sol(pb.sol.vec)
+    uu, xx = reconstruct_legendre_dofs(coors, None, u.swapaxes(0, 1)[:, :, None])
+    return {"n_cells": pb.domain.shape.n_el,
+            "quad_order": quad_order,
+            "fqps": qps.flatten(),
+            "ana_qp": ana_qp.flatten(),
+            "num_qp": num_qp.flatten(),
+            "xx": xx[:, 0],
+            "uu": uu[:, 0, 0]}
 
 
-def plot_1D_snr(conf, pb, ana_qp, num_qp, io, order, orders, ir, sol_fig, axs):
+def plot_1D_snr(conf, plot_data, io, order, orders, ir, sol_fig, axs):
     """
     Plot 1D solutions and errors
 
     :param conf:
+    :param plot_data: dict returned by get_1D_plot_data
     :param io: index of order
     :param ir: index of refirement
-    :param ana_qp:
-    :param num_qp:
     :param order:
     :param orders:
-    :param pb:
 
     :param sol_fig:
     :param axs:
     :return:
     """
-    idiff = Integral('idiff', 20)
     sol_fig.suptitle(
         "Numerical and exact solutions" +
         build_attrs_string(conf, remove_dots=False, sep=", "))
-    n_cells = pb.domain.shape.n_el
+    n_cells = plot_data["n_cells"]
+    fqps = plot_data["fqps"]
+    ana_qp = plot_data["ana_qp"]
+    num_qp = plot_data["num_qp"]
 
-    qps = pb.fields["f"].mapping.get_physical_qps(idiff.get_qp("1_2")[0])
-    fqps = qps.flatten()
-    coors = pb.domain.mesh.coors
-    u = pb.fields["f"].unravel_sol(pb.sol.vec)
-    uu, xx = reconstruct_legendre_dofs(coors, None, u.swapaxes(0, 1)[:, :, None])
     ax = axs[io][ir]
     xs = nm.linspace(conf.mstart, conf.mend, 500)[:, None]
     ax.set_title("o: {}, h: {}".format(order, n_cells))
     ax.plot(xs, conf.analytic_sol(xs, t=nm.array(1)), label="exact", color="grey")
-    ax.plot(xx[:, 0], uu[:, 0, 0], alpha=.5, label="num-lin")
-    ax.plot(fqps, ana_qp.flatten(), "--", color="grey", label="exact-qp")
-    ax.plot(fqps, num_qp.flatten(), label="num-qp")
+    ax.plot(plot_data["xx"], plot_data["uu"], alpha=.5, label="num-lin")
+    ax.plot(fqps, ana_qp, "--", color="grey", label="exact-qp")
+    ax.plot(fqps, num_qp, label="num-qp")
     ax2 = ax.twinx()
-    ax2.plot(fqps, nm.abs(num_qp.flatten() - ana_qp.flatten()), color="red",
+    ax2.plot(fqps, nm.abs(num_qp - ana_qp), color="red",
              label="error-qp")
 
     if io < len(orders) - 1:
@@ -17,10 +17,16 @@ from sfepy.base.ioutils import ensure_path
 from sfepy.base.base import (get_default, output, assert_,
                              Struct, basestr, IndexedStruct)
 
-from script.dg_plot_1D import load_and_plot_fun
-from run_dg_utils import clear_folder, add_dg_arguments, param_names
+from dg_plot_1D import load_and_plot_fun
+from run_dg_utils import clear_folder, add_dg_arguments, param_names, \
+    ErrorHistoryHook
 
 from run_dg_utils import outputs_folder, output, configure_output
+from expr_backend import set_num_threads
+from dg_time_series import series_format, get_series_filename, \
+    get_save_steps, DGTimeSeriesHook, export_frames
+from mesh_hierarchy import get_refined_mesh, get_cached_mesh_hook, \
+    is_cached_mesh
 
 
 def create_argument_parser():
@@ -44,6 +50,10 @@ def create_argument_parser():
                         default=None, metavar='path', action='store',
                         dest='mesh_file',)
 
+    parser.add_argument("-r", "--refine", metavar="int", type=int, default=0,
+                        help="Number of uniform refinements of the mesh, " +
+                             "refined meshes are cached", dest="refine")
+
     parser.add_argument('-dp', '--display-plots', help="To show plots for 1D case",
                         dest="doplot", action="store_true")
 
@@ -54,6 +64,28 @@ def create_argument_parser():
                         default=False, action='store_true',
                         dest='no_output_screen', )
 
+    parser.add_argument("--error-history", metavar="k", type=int, default=0,
+                        dest="error_history",
+                        help="Track L2 error and conserved quantities " +
+                             "every k time steps in error_history file, " +
+                             "needs sol_fun in the example")
+
+    parser.add_argument("--threads", metavar="int", type=int, default=1,
+                        help="Number of threads evaluating generated " +
+                             "example functions in chunks")
+
+    parser.add_argument("--output-format", metavar="format", default=None,
+                        dest="output_format",
+                        help="Output format overriding the one in the " +
+                             "example, {} saves all steps to ".format(
+                                 series_format) +
+                             "single DG time series file")
+
+    parser.add_argument("--export-series", metavar="format", default=None,
+                        choices=["vtk", "msh"], dest="export_series",
+                        help="Export frames of DG time series to vtk or " +
+                             "msh files after the run")
+
     parser.add_argument('--order', metavar="int", default=None,
                         help='Approximation order', type=int)
 
@@ -73,8 +105,15 @@ def get_parametrized_conf(filename, args):
     problem_module = importlib.import_module(problem_module_name)
 
     dg_args = {dg_par_name: args.__dict__[dg_par_name]
-               for dg_par_name in param_names + ["mesh_file", "order"]
+               for dg_par_name in param_names
                if args.__dict__[dg_par_name] is not None}
+    if args.order is not None:
+        dg_args["approx_order"] = args.order
+    if args.mesh_file is not None:
+        mesh_file = get_refined_mesh(args.mesh_file, args.refine)
+        if is_cached_mesh(mesh_file):
+            mesh_file = get_cached_mesh_hook(mesh_file)
+        dg_args["filename_mesh"] = mesh_file
 
     if hasattr(problem_module, "define"):
         mod = sys.modules[problem_module_name]
@@ -101,8 +140,11 @@ def main(argv):
     args = parser.parse_args(argv)
 
     conf_file_name = args.problem_file
+    set_num_threads(args.threads)
 
     pc = get_parametrized_conf(conf_file_name, args)
+    if args.output_format is not None:
+        pc.options.output_format = args.output_format
 
     if args.output_dir is None:
         output_folder = pjoin(outputs_folder, "output", pc.example_name)
@@ -124,13 +166,42 @@ def main(argv):
     output_name_trunk_name = pc.example_name + str(pc.approx_order)
     output_name_trunk = pjoin(output_name_trunk_folder, output_name_trunk_name)
     ensure_path(output_name_trunk_folder)
-    output_format = "{}.*.{}".format(output_name_trunk,
-                                      pc.options.output_format
-                                      if hasattr(pc.options, "output_format")
-                                      else "vtk")
-
-    output("Output set to {}, clearing.".format(output_format))
-    clear_folder(output_format, confirm=False)
+    output_ext = getattr(pc.options, "output_format", "vtk")
+    series_file = get_series_filename(output_name_trunk)
+    series_hook = None
+    if output_ext == series_format:
+        # files of steps left by earlier runs would shadow the series
+        for step_ext in ["vtk", "msh"]:
+            clear_folder("{}.*.{}".format(output_name_trunk, step_ext),
+                         confirm=False)
+        output("Output set to {}, clearing.".format(series_file))
+        series_hook = DGTimeSeriesHook(series_file,
+                                       getattr(pc.options, "save_times",
+                                               "all"))
+        # steps are saved by the hook
+        pc.options.save_times = 0
+        pc.options.output_format = "vtk" if pc.dim == 1 else "msh"
+    else:
+        output_format = "{}.*.{}".format(output_name_trunk, output_ext)
+        output("Output set to {}, clearing.".format(output_format))
+        clear_folder(output_format, confirm=False)
+        clear_folder(series_file, confirm=False)
+
+    step_hooks = []
+    if args.error_history:
+        step_hooks.append(ErrorHistoryHook(pc.sol_fun,
+                                           pjoin(output_name_trunk_folder,
+                                                 "error_history"),
+                                           args.error_history))
+    if series_hook is not None:
+        step_hooks.append(series_hook)
+
+    def step_hook(pb, ts, variables):
+        for hook in step_hooks:
+            hook(pb, ts, variables)
+
+    if step_hooks:
+        pc.options.step_hook = step_hook
 
     sa = PDESolverApp(pc, Struct(output_filename_trunk=output_name_trunk,
                                  save_ebc=False,
@@ -143,12 +214,26 @@ def main(argv):
     tt = time.process_time()
     sa()
     elapsed = time.process_time() - tt
+    for hook in step_hooks:
+        hook.close()
     output("{}: {}".format(pc.example_name, time.asctime()))
     output("------------------Finished------------------\n\n")
 
+    if series_hook is not None and args.export_series is not None:
+        export_frames(series_hook.writer.filename, output_name_trunk,
+                      args.export_series, pb=sa.problem,
+                      file_format="gmsh-dg"
+                      if args.export_series == "msh" else None)
+
     if pc.dim == 1 and args.doplot:
         if pc.transient:
-            load_times = min(pc.options.save_times, sa.problem.ts.n_step)
+            if series_hook is not None:
+                load_times = series_hook.writer.n_frames
+            else:
+                ts = sa.problem.ts
+                load_times = len(get_save_steps(pc.options.save_times,
+                                                ts.n_step,
+                                                getattr(ts, "times", None)))
             load_and_plot_fun(output_name_trunk_folder, output_name_trunk_name,
                               pc.t0, pc.t1, load_times,
                               pc.get_ic,
@@ -3,15 +3,34 @@ Script with utility functions for running DG examples and convergence studies
 """
 from glob import glob
 import os
+import sys
+import hashlib
+import inspect
+import pickle
+import shutil
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from matplotlib import pyplot as plt
 import numpy as nm
+import pandas as pd
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
-from sfepy.discrete import Integral, Material, Integrals
-from sfepy.discrete.common.mappings import get_jacobian
-from sfepy.base.base import output, configure_output
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+from sfepy.discrete import Integral
+from sfepy.base.base import output, configure_output, Struct
 from example_dg_common import diffusion_schemes_explicit, clear_folder
+from dg_qp_eval import DGQPEvaluator
 
 outputs_folder = "outputs"
 
@@ -20,6 +39,8 @@ outputs_folder = "outputs"
 
 param_names = ["adflux", "limit", "cw", "diffcoef", "diffscheme", "cfl", "dt"]
 
+cell_cache_folder = os.path.join(outputs_folder, "cell_cache")
+
 
 def add_dg_arguments(parser):
     """
@@ -108,44 +129,699 @@ def plot_conv_results(base_output_folder, conf, err_df,
     return conv_fig
 
 
-def compute_erros(analytic_fun, pb):
+class QPCache(object):
+    """
+    LRU cache of dicts of arrays in quadrature points, the least recently
+    used entries are dropped when total size of the arrays exceeds
+    max_nbytes.
+    """
+
+    def __init__(self, max_nbytes=2 ** 30):
+        self.max_nbytes = max_nbytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    @staticmethod
+    def _entry_nbytes(entry):
+        return sum(arr.nbytes for arr in entry.values())
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if key in self.entries:
+            self.nbytes -= self._entry_nbytes(self.entries.pop(key))
+        self.entries[key] = entry
+        self.nbytes += self._entry_nbytes(entry)
+        while self.nbytes > self.max_nbytes and len(self.entries) > 1:
+            _, old_entry = self.entries.popitem(last=False)
+            self.nbytes -= self._entry_nbytes(old_entry)
+
+
+# physical qps, jacobians and analytic solution values shared by all
+# approximation orders on one mesh
+analytic_qp_cache = QPCache()
+
+
+def get_mesh_key(domain):
+    key = hashlib.sha1()
+    mesh = domain.mesh
+    key.update(nm.ascontiguousarray(mesh.coors).tobytes())
+    for desc in mesh.descs:
+        key.update(nm.ascontiguousarray(mesh.get_conn(desc)).tobytes())
+    return key.hexdigest()
+
+
+def eval_analytic_qp(analytic_fun, pb, qps):
+    """
+    Evaluates analytic solution, material function, in physical qps
+    of shape (n_el, n_qp, dim) as done by ev_volume_integrate_mat.
+
+    :return: values, shape (n_el, n_qp, 1, 1)
+    """
+    n_el, n_qp, dim = qps.shape
+    vals, = analytic_fun(pb.ts, qps.reshape((-1, dim)), mode="qp",
+                         problem=pb).values()
+    return vals.reshape((n_el, n_qp, 1, 1))
+
+
+norm_names = ["ana_l1", "diff_l1", "ana_linf", "diff_linf",
+              "diff_h1_semi", "diff_energy"]
+
+
+def eval_error_qps(analytic_fun, pb, quad_order=20, fun_key=None):
+    """
+    Evaluates numerical and analytic solution in qps of quadrature of
+    quad_order, these arrays are shared by all the norms.
+
+    :param analytic_fun: analytic solution
+    :param pb: problem with numerical solution
+    :param quad_order: order of the quadrature
+    :param fun_key: key identifying analytic_fun across problems, if given
+        the analytic values are stored in analytic_qp_cache under the key,
+        mesh, quadrature order and time
+    :return: DGQPEvaluator, DOFs, values of numerical solution in qps,
+             dict with qps, det and ana_qp, key in analytic_qp_cache
+    """
+    idiff = Integral('idiff', quad_order)
+    var = pb.get_variables()['p']
+    evaluator = DGQPEvaluator(var.field, idiff)
+    dofs = evaluator.unravel(var())
+    num_qp = evaluator.eval_vals(dofs)
+
+    cache_key = None
+    qp_data = None
+    if fun_key is not None:
+        cache_key = (fun_key, get_mesh_key(pb.domain), quad_order,
+                     pb.ts.time)
+        qp_data = analytic_qp_cache.get(cache_key)
+    if qp_data is None:
+        qp_data = {"qps": evaluator.qps,
+                   "det": evaluator.det,
+                   "ana_qp": eval_analytic_qp(analytic_fun, pb,
+                                              evaluator.qps)}
+        if cache_key is not None:
+            analytic_qp_cache.put(cache_key, qp_data)
+    return evaluator, dofs, num_qp, qp_data, cache_key
+
+
+def compute_value_norms(num_qp, qp_data):
+    """
+    :return: analytic_fun L2 norm, L2 norm of the error, relative L2 error,
+             dict of norms with keys norm_names, the gradient based are NaN
+    """
+    det = qp_data["det"]
+    ana_qp = qp_data["ana_qp"]
+
+    diff_qp = num_qp - ana_qp
+    diff_l2 = nm.sqrt(((diff_qp ** 2) * det).sum())
+    ana_l2 = nm.sqrt(((ana_qp ** 2) * det).sum())
+    rel_l2 = diff_l2 / ana_l2
+
+    norms = {
+        "ana_l1": (nm.abs(ana_qp) * det).sum(),
+        "diff_l1": (nm.abs(diff_qp) * det).sum(),
+        "ana_linf": nm.max(nm.abs(ana_qp)),
+        "diff_linf": nm.max(nm.abs(diff_qp)),
+        "diff_h1_semi": nm.nan,
+        "diff_energy": nm.nan,
+    }
+    return ana_l2, diff_l2, rel_l2, norms
+
+
+def add_grad_norms(norms, analytic_fun, analytic_grad_fun, pb, evaluator,
+                   dofs, qp_data, cache_key=None, diffcoef=None, cw=None):
+    """
+    Computes H1 seminorm and DG energy norm of the error into norms from
+    the arrays of eval_error_qps.
+
+    :param analytic_grad_fun: gradient of analytic solution, material
+        function, or None to differentiate the analytic solution numerically
+    :param diffcoef: diffusion coefficient for the DG energy norm, 1 if None
+    :param cw: penalty coefficient for the DG energy norm, the norm is NaN
+        if None
+    """
+    num_grad_qp = evaluator.eval_grads(dofs)
+    if "ana_grad_qp" not in qp_data:
+        if analytic_grad_fun is None:
+            qp_data["ana_grad_qp"] = eval_fd_grad_qp(analytic_fun, pb,
+                                                     qp_data["qps"])
+        else:
+            qp_data["ana_grad_qp"] = eval_analytic_grad_qp(analytic_grad_fun,
+                                                           pb, qp_data["qps"])
+        if cache_key is not None:
+            analytic_qp_cache.put(cache_key, qp_data)
+    diff_h1_semi2 = ((num_grad_qp - qp_data["ana_grad_qp"]) ** 2
+                     * qp_data["det"]).sum()
+    norms["diff_h1_semi"] = nm.sqrt(diff_h1_semi2)
+    if cw is not None:
+        norms["diff_energy"] = nm.sqrt(
+            (1 if diffcoef is None else diffcoef) * diff_h1_semi2
+            + compute_jump_penalty(pb, analytic_fun, cw, diffcoef))
+    return norms
+
+
+def compute_erros(analytic_fun, pb, quad_order=20, grad_norms=False,
+                  diffcoef=None, cw=None, fun_key=None,
+                  analytic_grad_fun=None):
     """
     Compute errors from analytical solution in conf.sol_fun and numerical
     solution saved in pb
     :param analytic_fun: analytic solution
     :param pb: problem with numerical solution
+    :param quad_order: order of the quadrature used for errors
+    :param grad_norms: compute also H1 seminorm and DG energy norm of the
+        error, otherwise they are NaN
+    :param diffcoef: diffusion coefficient for the DG energy norm, 1 if None
+    :param cw: penalty coefficient for the DG energy norm, the norm is NaN
+        if None
+    :param fun_key: key identifying analytic_fun across problems, if given
+        the analytic values are stored in analytic_qp_cache under the key,
+        mesh, quadrature order and time
+    :param analytic_grad_fun: gradient of analytic solution, central
+        differences of analytic_fun are used if None
     :return: analytic_fun L2 norm,
              vaules of analytic_fun in qps
              L2 norm of difference between analytic and numerical solution
              relative difference
              values of numerical solution in qps
+             dict of other norms with keys norm_names
+             dict with qps and det of the quadrature
+    """
+    evaluator, dofs, num_qp, qp_data, cache_key = \
+        eval_error_qps(analytic_fun, pb, quad_order, fun_key)
+    ana_l2, diff_l2, rel_l2, norms = compute_value_norms(num_qp, qp_data)
+    if grad_norms:
+        add_grad_norms(norms, analytic_fun, analytic_grad_fun, pb,
+                       evaluator, dofs, qp_data, cache_key, diffcoef, cw)
+    return (ana_l2, qp_data["ana_qp"], diff_l2, rel_l2, num_qp, norms,
+            qp_data)
+
+
+def eval_analytic_grad_qp(analytic_grad_fun, pb, qps):
+    """
+    Evaluates gradient of analytic solution, material function, in
+    physical qps of shape (n_el, n_qp, dim).
+
+    :return: gradient values, shape (n_el, n_qp, dim, 1)
+    """
+    n_el, n_qp, dim = qps.shape
+    vals, = analytic_grad_fun(pb.ts, qps.reshape((-1, dim)), mode="qp",
+                              problem=pb).values()
+    return vals.reshape((n_el, n_qp, dim, 1))
+
+
+def eval_fd_grad_qp(analytic_fun, pb, qps, rel_step=6e-6):
+    """
+    Evaluates gradient of analytic solution in physical qps of shape
+    (n_el, n_qp, dim) by central differences, used for examples without
+    analytic gradient.
+
+    :param rel_step: step relative to the size of the domain
+    :return: gradient values, shape (n_el, n_qp, dim, 1)
+    """
+    n_el, n_qp, dim = qps.shape
+    coors = qps.reshape((-1, dim))
+    step = rel_step * max(nm.ptp(coors, axis=0).max(), 1.)
+
+    def eval_fun(coors):
+        vals, = analytic_fun(pb.ts, coors, mode="qp", problem=pb).values()
+        return vals.reshape((n_el, n_qp))
+
+    grad = nm.empty((n_el, n_qp, dim, 1))
+    for ii in range(dim):
+        shift = nm.zeros(dim)
+        shift[ii] = step
+        grad[..., ii, 0] = (eval_fun(coors + shift)
+                            - eval_fun(coors - shift)) / (2 * step)
+    return grad
+
+
+def compute_jump_penalty(pb, analytic_fun, cw, diffcoef=None):
+    """
+    Computes jump part of the squared DG energy norm of the error, i.e.
+    sum over facets of D * cw * order^2 / |F| * ||[e]||^2_F with the
+    penalty of dw_dg_interior_penalty. Jumps of the error on interior
+    facets are jumps of the numerical solution, on boundary facets the
+    analytic solution is the outer value, so the jump is the error itself.
+
+    :param pb: problem with numerical solution
+    :param analytic_fun: analytic solution, material function
+    :param cw: penalty coefficient
+    :param diffcoef: diffusion coefficient, 1 if None
     """
-    idiff = Integral('idiff', 20)
-    num_qp = pb.evaluate(
-        'ev_volume_integrate.idiff.Omega(p)',
-        integrals=Integrals([idiff]), mode='qp',
-        copy_materials=False, verbose=False
-    )
-    aux = Material('aux', function=analytic_fun)
-    ana_qp = pb.evaluate(
-        'ev_volume_integrate_mat.idiff.Omega(aux.p, p)',
-        aux=aux, integrals=Integrals([idiff]), mode='qp',
-        copy_materials=False, verbose=False
-    )
     field = pb.fields['f']
-    det = get_jacobian(field, idiff)
-    diff_l2 = nm.sqrt((((num_qp - ana_qp) ** 2) * det).sum())
-    ana_l2 = nm.sqrt(((ana_qp ** 2) * det).sum())
-    rel_l2 = diff_l2 / ana_l2
+    var = pb.get_variables()['p']
+    inner_vals, outer_vals, whs = field.get_both_facet_state_vals(
+        var, field.region)
+    neighbours = field.get_facet_neighbor_idx(field.region, var.eq_map)
+
+    # physical facet qps, shape (n_el_facets, n_qp, n_cell, dim)
+    facet_qps, _ = field.get_facet_qp()
+    coors = field.mapping.get_physical_qps(facet_qps[:, 0, :, :])
+    if coors.ndim == 3:
+        coors = coors[:, None, :, :].swapaxes(0, 2)
+    cells, facets = nm.where(neighbours[..., 0] < 0)
+    bcoors = coors[facets, :, cells]
+    vals, = analytic_fun(pb.ts, bcoors.reshape((-1, field.dim)), mode="qp",
+                         problem=pb).values()
+    outer_vals[cells, facets] = vals.reshape(bcoors.shape[:2])
+
+    jump2 = nm.sum((inner_vals - outer_vals) ** 2 * whs, axis=-1)
+    facet_vols = nm.sum(whs, axis=-1)
+
+    # interior facets are visited from both of their cells
+    visits = nm.where(neighbours[..., 0] >= 0, .5, 1.)
+
+    sigma = ((1 if diffcoef is None else diffcoef)
+             * cw * field.approx_order ** 2 / facet_vols)
+    return nm.sum(visits * sigma * jump2)
+
+
+def compute_erros_adaptive(analytic_fun, pb, tol=1e-3, max_order=20, step=2,
+                           grad_norms=False, diffcoef=None, cw=None,
+                           fun_key=None, analytic_grad_fun=None):
+    """
+    Compute errors as compute_erros, starting from quadrature order
+    2 * (approx_order + 1) and raising it by step until relative change
+    of the L2 error is below tol or max_order is reached. Gradient based
+    norms are computed only for the last quadrature order, from the arrays
+    of its pass.
+
+    :param analytic_fun: analytic solution
+    :param pb: problem with numerical solution
+    :param tol: relative tolerance for change of the L2 error
+    :param max_order: maximal quadrature order
+    :param step: increase of the quadrature order
+    :param grad_norms, diffcoef, cw, fun_key, analytic_grad_fun: passed to
+        compute_erros
+    :return: outputs of compute_erros for the last quadrature order,
+             the last quadrature order
+    """
+    quad_order = min(2 * (pb.fields['f'].approx_order + 1), max_order)
+    qp_arrays = eval_error_qps(analytic_fun, pb, quad_order, fun_key)
+    errs = compute_value_norms(qp_arrays[2], qp_arrays[3])
+    while quad_order < max_order:
+        next_order = min(quad_order + step, max_order)
+        next_arrays = eval_error_qps(analytic_fun, pb, next_order, fun_key)
+        next_errs = compute_value_norms(next_arrays[2], next_arrays[3])
+        change = abs(next_errs[1] - errs[1])
+        quad_order, qp_arrays, errs = next_order, next_arrays, next_errs
+        if change <= tol * errs[1]:
+            break
+
+    evaluator, dofs, num_qp, qp_data, cache_key = qp_arrays
+    ana_l2, diff_l2, rel_l2, norms = errs
+    if grad_norms:
+        add_grad_norms(norms, analytic_fun, analytic_grad_fun, pb,
+                       evaluator, dofs, qp_data, cache_key, diffcoef, cw)
+    return (ana_l2, qp_data["ana_qp"], diff_l2, rel_l2, num_qp, norms,
+            qp_data, quad_order)
+
+
+def compute_cell_errors(qp_data, ana_qp, num_qp):
+    """
+    Computes error of numerical solution in each cell.
+
+    :param qp_data: dict with qps and det of the quadrature ana_qp and
+        num_qp are in, as returned by compute_erros
+    :param ana_qp: values of analytic solution in qps
+    :param num_qp: values of numerical solution in qps
+    :return: dict with cell_l2 and cell_linf errors, shape (n_cell,),
+             and cell centroids, shape (n_cell, dim)
+    """
+    det = qp_data["det"][..., 0, 0]
+    diff_qp = (num_qp - ana_qp).reshape(det.shape)
+    return {"cell_l2": nm.sqrt((diff_qp ** 2 * det).sum(axis=1)),
+            "cell_linf": nm.abs(diff_qp).max(axis=1),
+            "centroids": (qp_data["qps"] * det[..., None]).sum(axis=1)
+                         / det.sum(axis=1)[:, None]}
+
+
+def get_cell_errors_filename(sol_file):
+    return os.path.splitext(sol_file)[0] + ".cell_errors.npz"
+
+
+def save_cell_errors(filename, cell_errors, **kwargs):
+    """
+    Saves dict from compute_cell_errors and other arrays in kwargs
+    to compressed .npz file.
+    """
+    nm.savez_compressed(filename, **cell_errors, **kwargs)
+
+
+def load_cell_errors(filename):
+    with nm.load(filename) as data:
+        return dict(data)
+
+
+def get_cell_errors_out(cell_errors):
+    """
+    Converts per cell errors to cell data of the output dict used by
+    Problem.save_state, so they are written along with the solution.
+    """
+    return {name: Struct(name="output_data", mode="cell",
+                         data=cell_errors[name][:, None, None, None],
+                         dofs=None)
+            for name in ["cell_l2", "cell_linf"]}
+
+
+history_columns = ["step", "time", "ana_l2", "diff_l2", "err_rel",
+                   "mass", "ana_mass", "energy", "u_min", "u_max"]
 
-    diff_loo = nm.max(num_qp - ana_qp)
-    ana_loo = nm.max(ana_qp)
-    rel_loo = diff_loo / ana_loo
 
-    diff_l1 = nm.sqrt((nm.abs(num_qp - ana_qp) * det).sum())
-    ana_l1 = nm.sqrt((nm.abs(ana_qp) * det).sum())
-    rel_l1 = diff_l2 / ana_l2
-    return ana_l2, ana_qp, diff_l2, rel_l2, num_qp
+class ErrorHistoryHook(object):
+    """
+    Step hook of Problem.solve tracking the L2 error and conserved
+    quantities, mass and energy i.e. integrals of u and u**2 / 2, every
+    few steps, computed from the state in memory and streamed to
+    a ResultsStream with history_columns.
+    """
+
+    def __init__(self, analytic_fun, filename_trunk, every=1,
+                 quad_order=20, var_name="p"):
+        """
+        :param analytic_fun: analytic solution, material function
+        :param filename_trunk: file name of the stream without extension
+        :param every: track every n-th step, the last step is always tracked
+        :param quad_order: order of the quadrature
+        :param var_name: name of the DG variable
+        """
+        self.analytic_fun = analytic_fun
+        self.every = max(every, 1)
+        self.quad_order = quad_order
+        self.var_name = var_name
+        self.evaluator = None
+        self.stream = ResultsStream(filename_trunk, history_columns)
+
+    def __call__(self, pb, ts, variables):
+        if ts.step % self.every and ts.step != ts.n_step - 1:
+            return
+
+        var = variables[self.var_name]
+        if self.evaluator is None:
+            self.evaluator = DGQPEvaluator(var.field,
+                                           Integral('idiff', self.quad_order))
+        evaluator = self.evaluator
+        det = evaluator.det
+        num_qp = evaluator.eval_vals(evaluator.unravel(var()))
+        ana_qp = eval_analytic_qp(self.analytic_fun, pb, evaluator.qps)
+
+        ana_l2 = nm.sqrt(((ana_qp ** 2) * det).sum())
+        diff_l2 = nm.sqrt((((num_qp - ana_qp) ** 2) * det).sum())
+        self.stream.append((ts.step, ts.time, ana_l2, diff_l2,
+                            diff_l2 / ana_l2,
+                            (num_qp * det).sum(), (ana_qp * det).sum(),
+                            (num_qp ** 2 * det).sum() / 2,
+                            num_qp.min(), num_qp.max()))
+
+    def close(self):
+        self.stream.close()
+
+
+def get_cell_cache_key(problem_module, define_kwargs, refine, order,
+                       filename_mesh, extra=()):
+    """
+    Computes content address of one convergence study cell.
+
+    :param problem_module: module with define method, its source is hashed
+    :param define_kwargs: keyword arguments passed to define
+    :param refine: refinement level
+    :param order: approximation order
+    :param filename_mesh: mesh file, its contents are hashed, or other
+        value passed to define as filename_mesh
+    :param extra: other values affecting the cell outputs, e.g. layout of
+        the result row or quadrature of the errors
+    :return: hex digest
+    """
+    key = hashlib.sha1()
+    with open(inspect.getsourcefile(problem_module), "rb") as f:
+        key.update(f.read())
+    key.update(repr(sorted((k, v) for k, v in define_kwargs.items()
+                           if k != "filename_mesh")).encode())
+    key.update(repr((refine, order)).encode())
+    key.update(repr(tuple(extra)).encode())
+    if isinstance(filename_mesh, str) and os.path.isfile(filename_mesh):
+        with open(filename_mesh, "rb") as f:
+            key.update(f.read())
+    else:
+        key.update(repr(filename_mesh).encode())
+    return key.hexdigest()
+
+
+def load_cached_cell(cache_folder, key, output_folder):
+    """
+    Loads cached outputs of convergence study cell and restores
+    saved solution files into output_folder.
+
+    :param cache_folder: folder with cached cells
+    :param key: key from get_cell_cache_key
+    :param output_folder: folder to copy the cached solution to
+    :return: cached cell outputs or None if cell is not cached
+    """
+    cell_folder = os.path.join(cache_folder, key)
+    try:
+        with open(os.path.join(cell_folder, "cell.pkl"), "rb") as f:
+            sol_names, cell_outs = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    os.makedirs(output_folder, exist_ok=True)
+    if isinstance(sol_names, str):
+        sol_names = [sol_names]
+    try:
+        for sol_name in sol_names:
+            shutil.copy2(os.path.join(cell_folder, sol_name),
+                         os.path.join(output_folder, sol_name))
+    except OSError:  # incomplete entry, the cell is recomputed
+        return None
+    return cell_outs
+
+
+def save_cached_cell(cache_folder, key, sol_files, cell_outs):
+    """
+    Stores outputs of convergence study cell along with the saved solution.
+
+    :param cache_folder: folder with cached cells
+    :param key: key from get_cell_cache_key
+    :param sol_files: file with saved solution or list of files, e.g.
+        with the solution and its sidecars
+    :param cell_outs: picklable outputs of the cell
+    """
+    cell_folder = os.path.join(cache_folder, key)
+    os.makedirs(cell_folder, exist_ok=True)
+    # entry is incomplete until cell.pkl is written again
+    try:
+        os.remove(os.path.join(cell_folder, "cell.pkl"))
+    except FileNotFoundError:
+        pass
+    if isinstance(sol_files, str):
+        sol_files = [sol_files]
+    sol_names = [os.path.basename(sol_file) for sol_file in sol_files]
+    for sol_file, sol_name in zip(sol_files, sol_names):
+        shutil.copy2(sol_file, os.path.join(cell_folder, sol_name))
+
+    # cell.pkl marks complete entry, write it last and atomically
+    tmp_name = os.path.join(cell_folder, "cell.pkl.{}".format(os.getpid()))
+    with open(tmp_name, "wb") as f:
+        pickle.dump((sol_names, cell_outs), f)
+    os.replace(tmp_name, os.path.join(cell_folder, "cell.pkl"))
+
+
+class PhaseTimer(object):
+    """
+    Accumulates wall and CPU time spent in named phases.
+    """
+
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_sum, cpu_sum = self.times.get(name, (0., 0.))
+            self.times[name] = (wall_sum + time.perf_counter() - wall,
+                                cpu_sum + time.process_time() - cpu)
+
+    def wrap(self, name, fun):
+        """
+        Returns callable timing calls of fun in phase name, other attributes
+        are taken from fun, so solvers can be wrapped as well.
+        """
+        return TimedCallable(self, name, fun)
+
+    def get_row(self, phases):
+        """
+        :return: tuple of wall and CPU times for phases as ordered by
+            get_phase_columns, phases never entered have zero times
+        """
+        row = ()
+        for name in phases:
+            row += self.times.get(name, (0., 0.))
+        return row
+
+
+class TimedCallable(object):
+
+    def __init__(self, timer, name, fun):
+        self.timer = timer
+        self.name = name
+        self.fun = fun
+
+    def __call__(self, *args, **kwargs):
+        with self.timer.phase(self.name):
+            return self.fun(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.fun, name)
+
+
+def reset_peak_rss():
+    """
+    Resets peak resident set size of this process, works on Linux only.
+
+    :return: True if peak was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss():
+    """
+    :return: peak resident set size of this process in bytes since start or
+        last reset_peak_rss, NaN if unknown
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return float(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return float(max_rss) * (1 if sys.platform == "darwin" else 1024)
+    return nm.nan
+
+
+def get_sparse_nbytes(mtx):
+    if hasattr(mtx, "indptr"):
+        return mtx.data.nbytes + mtx.indices.nbytes + mtx.indptr.nbytes
+    return getattr(mtx, "nbytes", 0)
+
+
+def get_history_nbytes(pb):
+    """
+    :return: bytes held by data of all steps stored in problem variables
+    """
+    nbytes = 0
+    for var in pb.get_variables():
+        for step_data in getattr(var, "data", None) or []:
+            if step_data is not None:
+                nbytes += step_data.nbytes
+    return nbytes
+
+
+def save_tracemalloc_top(snapshot, filename, limit):
+    """
+    Writes limit top allocation sites of tracemalloc snapshot to filename.
+    """
+    stats = snapshot.statistics("lineno")
+    with open(filename, "w") as f:
+        for stat in stats[:limit]:
+            f.write(str(stat) + "\n")
+
+
+def get_phase_columns(phases):
+    columns = []
+    for name in phases:
+        columns += [name + "_wall", name + "_cpu"]
+    return columns
+
+
+class ResultsStream(object):
+    """
+    Appends result rows to a file and flushes them as soon as they are
+    computed, so that finished rows survive a crash of the study. Uses Arrow
+    IPC stream when the optional pyarrow is available and CSV lines
+    otherwise.
+    """
+
+    def __init__(self, filename_trunk, columns):
+        """
+        :param filename_trunk: file name without extension
+        :param columns: names of the result columns, all values are floats
+        """
+        self.columns = list(columns)
+        if pa is not None:
+            self.filename = filename_trunk + ".arrows"
+            self.schema = pa.schema([(col, pa.float64())
+                                     for col in self.columns])
+            self._file = open(self.filename, "wb")
+            self._writer = pa.ipc.new_stream(self._file, self.schema)
+        else:
+            self.filename = filename_trunk + ".stream.csv"
+            self._file = open(self.filename, "w")
+            self._writer = None
+            self._file.write(",".join(self.columns) + "\n")
+        self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, row):
+        row = [float(val) for val in row]
+        if self._writer is not None:
+            self._writer.write_batch(pa.record_batch(
+                [pa.array([val], pa.float64()) for val in row],
+                schema=self.schema))
+        else:
+            self._file.write(",".join(repr(val) for val in row) + "\n")
+        self._flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._file.close()
+
+    def read(self):
+        return read_results_stream(self.filename)
+
+
+def read_results_stream(filename):
+    """
+    Reads rows written by ResultsStream, also from a stream truncated by
+    a crash.
+
+    :param filename: .arrows or .stream.csv file
+    :return: dataframe with the result rows
+    """
+    if not filename.endswith(".arrows"):
+        return pd.read_csv(filename)
+    if pa is None:
+        raise ImportError("reading {} requires pyarrow, install it with "
+                          "'pip install pyarrow'".format(filename))
+
+    batches = []
+    with open(filename, "rb") as f:
+        reader = pa.ipc.open_stream(f)
+        try:
+            for batch in reader:
+                batches.append(batch)
+        except pa.ArrowInvalid:  # last batch was not written completely
+            pass
+    return pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
 
 
 def build_attrs_string(conf, attrs=("Cw", "diffusion_coef", "dt", "CFL"),
@@ -0,0 +1,52 @@
+"""
+Error norms of run_dg_utils compared with assembled DG terms.
+"""
+import importlib
+
+import numpy as nm
+import pytest
+
+pytest.importorskip("sfepy")
+try:
+    import run_dg_conv_study as rcs
+except ImportError as exc:  # sfepy version without the DG API used here
+    pytest.skip(str(exc), allow_module_level=True)
+
+from sfepy.discrete import Problem
+
+from run_dg_utils import compute_jump_penalty
+
+
+def create_problem(problem_file, order, cw, diffcoef):
+    args = rcs.create_argument_parser().parse_args(
+        [problem_file, "--diffscheme", "symmetric", "--cw", str(cw),
+         "--diffcoef", str(diffcoef), "--adflux", "0"])
+    problem_module = importlib.import_module(
+        rcs.get_problem_module_name(problem_file))
+    conf = rcs.create_conf(problem_module, args, None, order)
+    pb = Problem.from_conf(conf)
+    pb.time_update()
+    return pb
+
+
+def zero_fun(ts, coors, mode="qp", **kwargs):
+    return {"p": nm.zeros(coors.shape[:-1] + (1, 1))}
+
+
+@pytest.mark.parametrize("problem_file, cw_name", [
+    ("diffusion/example_dg_diffusion1D.py", "Cw"),
+    ("advection/example_dg_quarteroni1.py", "cw"),
+])
+def test_jump_penalty(problem_file, cw_name):
+    cw, diffcoef = 10., .5
+    pb = create_problem(problem_file, 2, cw, diffcoef)
+    var = pb.get_variables()["p"]
+    vec = nm.random.RandomState(0).rand(var.n_dof)
+    var.set_data(vec)
+
+    # with zero analytic solution the jumps on boundary facets are the
+    # inner values, as in the assembled penalty matrix
+    mtx = pb.evaluate("dw_dg_interior_penalty.i.Omega(D.val, D.{}, v, p)"
+                      .format(cw_name), mode="weak", dw_mode="matrix")
+    assert compute_jump_penalty(pb, zero_fun, cw, diffcoef) \
+        == pytest.approx(vec @ (mtx @ vec), rel=1e-10)
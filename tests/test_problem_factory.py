@@ -0,0 +1,47 @@
+"""
+Problems created by ProblemFactory must be set up as by Problem.from_conf.
+"""
+import importlib
+
+import numpy as nm
+import pytest
+
+pytest.importorskip("sfepy")
+try:
+    import run_dg_conv_study as rcs
+except ImportError as exc:  # sfepy version without the DG API used here
+    pytest.skip(str(exc), allow_module_level=True)
+
+from sfepy.discrete import Problem
+
+problem_file = "diffusion/example_dg_diffusion1D.py"
+
+
+def create_conf(order):
+    args = rcs.create_argument_parser().parse_args(
+        [problem_file, "--diffscheme", "symmetric", "--cw", "100",
+         "--diffcoef", "1"])
+    problem_module = importlib.import_module(
+        rcs.get_problem_module_name(problem_file))
+    # mesh generated by the example
+    return rcs.create_conf(problem_module, args, None, order)
+
+
+def solve(pb):
+    pb.solve(save_results=False)
+    return pb.get_variables()["p"]()
+
+
+@pytest.mark.parametrize("order", [1, 2])
+def test_factory_problem_solution(order):
+    conf = create_conf(order)
+    factory = rcs.ProblemFactory(create_conf(1))
+    pb_factory = factory.create_problem(conf)
+    pb_conf = Problem.from_conf(conf)
+
+    assert pb_factory.domain is factory.domain
+    for name in ["ts_conf", "nls_conf", "ls_conf"]:
+        solver_conf = getattr(pb_factory, name)
+        assert solver_conf.to_dict() == getattr(pb_conf, name).to_dict()
+
+    nm.testing.assert_array_equal(solve(pb_factory), solve(pb_conf))